@@ -1,28 +1,28 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import datetime
+from gaze_tracking.plotting import plot_vertical_gaze
+from gaze_tracking.summary import session_features, session_series
 
 try:
-    df = pd.read_csv("psp_data.csv")
+    features = session_features("psp_data.csv")
 except FileNotFoundError:
     print("No psp_data.csv found. Run the demo script first.")
     exit()
-
-if 't' not in df or df.empty:
+except ValueError:
     print("Invalid or empty CSV.")
     exit()
 
-df['t'] = pd.to_datetime(df['t'], unit='s', errors='coerce')
-df = df.dropna(subset=['t'])
+if not features["duration_min"] > 0:
+    print("Invalid or empty CSV.")
+    exit()
 
-duration_min = (df['t'].iloc[-1] - df['t'].iloc[0]).total_seconds() / 60
-blink_rate = df['blink'].sum() / duration_min
-saccades = df[df['sac_start'].notna()]
-saccade_rate = len(saccades) / duration_min
-avg_sac_vel = saccades['sac_vel'].astype(float).mean()
-avg_sac_amp = saccades['sac_amp'].astype(float).mean()
-jitter_count = df['jitter_t'].notna().sum()
-v_range = df['v_ratio'].max() - df['v_ratio'].min()
+duration_min = features["duration_min"]
+blink_rate = features["blink_rate"]
+saccade_rate = features["saccade_rate"]
+avg_sac_vel = features["saccade_velocity"]
+avg_sac_amp = features["saccade_amplitude"]
+jitter_count = features["jitter_count"]
+v_range = features["v_range"]
 
 def classify(val, thresholds, labels):
     for t, l in zip(thresholds, labels):
@@ -58,14 +58,9 @@ for k, v in summary.items():
 sum_df = pd.DataFrame([summary])
 sum_df.to_csv("psp_summary.csv", index=False)
 
-plt.figure(figsize=(10, 4))
-plt.plot(df['t'], df['v_ratio'], label='Vertical Gaze', color='blue')
-if not saccades.empty:
-    plt.scatter(saccades['t'], saccades['v_ratio'], color='red', label='Saccades')
-plt.xlabel("Time")
-plt.ylabel("Vertical Ratio")
-plt.title("Vertical Gaze Over Time")
-plt.legend()
+fig, ax = plt.subplots(figsize=(10, 4))
+plot_vertical_gaze(ax, *session_series("psp_data.csv"), width=int(fig.get_figwidth() * fig.dpi))
+ax.set_title("Vertical Gaze Over Time")
 plt.tight_layout()
 plt.savefig("psp_plot.png")
 print("\nSaved plot to psp_plot.png and summary to psp_summary.csv")
@@ -2,6 +2,8 @@
 
 import pandas as pd
 import matplotlib.pyplot as plt
+from gaze_tracking.plotting import plot_vertical_gaze
+from gaze_tracking.summary import session_features, session_series
 
 #NOTES: FIX THRESHOLDS BASED ON RESEARCH
 def classify_blink_rate(r):
@@ -31,17 +33,13 @@ def classify_vrange(r):
 
 
 def main():
-    df = pd.read_csv("psp_data.csv")
-    df['t'] = pd.to_datetime(df['t'], unit='s', errors='coerce')
-    df = df.dropna(subset=['t'])
+    features = session_features("psp_data.csv")
 
-    duration_min   = (df['t'].iloc[-1] - df['t'].iloc[0]).total_seconds() / 60
-    blink_rate     = df['blink'].sum() / duration_min
-    saccades       = df[df['sac_vel'].notna()]
-    avg_sac_vel    = saccades['sac_vel'].astype(float).mean() if not saccades.empty else 0
-    avg_sac_amp    = saccades['sac_amp'].astype(float).mean() if not saccades.empty else 0
-    jitter_count   = df['jitter_t'].notna().sum()
-    v_range        = df['v_ratio'].max() - df['v_ratio'].min()
+    blink_rate     = features["blink_rate"]
+    avg_sac_vel    = features["saccade_velocity"] if features["saccade_count"] else 0
+    avg_sac_amp    = features["saccade_amplitude"] if features["saccade_count"] else 0
+    jitter_count   = features["jitter_count"]
+    v_range        = features["v_range"]
 
     #print table
     summary = pd.DataFrame({
@@ -70,16 +68,10 @@ def main():
     print("\nPSP Session Feature Summary:\n")
     print(summary.to_string(index=False))
 
-    #plot vertical gaze with saccades
-    plt.figure(figsize=(10,4))
-    plt.plot(df['t'], df['v_ratio'], label='Vertical Gaze')
-    if not saccades.empty:
-        plt.scatter(saccades['t'], saccades['v_ratio'],
-                    color='red', label='Saccades', zorder=5)
-    plt.xlabel("Time")
-    plt.ylabel("Vertical Ratio")
-    plt.title("Vertical Gaze Over Time with Saccades Highlighted")
-    plt.legend()
+    #plot vertical gaze with saccades, decimated to the width of the figure
+    fig, ax = plt.subplots(figsize=(10,4))
+    plot_vertical_gaze(ax, *session_series("psp_data.csv"), width=int(fig.get_figwidth() * fig.dpi))
+    ax.set_title("Vertical Gaze Over Time with Saccades Highlighted")
     plt.tight_layout()
     plt.show()
 
@@ -0,0 +1,39 @@
+#summary features of a whole archive of sessions, in one table
+#
+#   python batch_analyze.py sessions/ "archive/2025-*/*.csv" -o cohort_summary.csv
+#
+#directories are searched recursively for .csv and .pspg session files; files already analyzed
+#(same content, same analyzer version) are read from the cache
+
+import argparse
+import os
+import time
+from gaze_tracking.summary import SummaryCache, session_files, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the PSP summary features of many sessions")
+    parser.add_argument("inputs", nargs="+", help="session files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="psp_batch_summary.csv", help="combined summary table")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--cache", default=".psp_summary_cache.json", help="result cache ('' to disable)")
+    args = parser.parse_args()
+
+    start = time.time()
+    paths = session_files(args.inputs, exclude=(args.output,))
+    cache = SummaryCache(args.cache) if args.cache else None
+    known = len(cache.summaries) if cache is not None else 0
+
+    table = summarize(paths, workers=args.workers, cache=cache)
+    if cache is not None:
+        cache.save()
+    table.to_csv(args.output, index=False)
+
+    analyzed = len(cache.summaries) - known if cache is not None else len(paths)
+    failed = int(table["error"].notna().sum()) if "error" in table else 0
+    print(f"[BATCH] {len(paths)} sessions ({analyzed} analyzed, {failed} failed) in {time.time() - start:.1f}s "
+          f"→ {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#per-stage benchmark of the gaze pipeline, no webcam needed
+#
+#   python -m benchmarks.bench_pipeline -o bench.json                 (synthetic frames)
+#   python -m benchmarks.bench_pipeline --source clip -o bench.json   (checked-in clip)
+#   python -m benchmarks.bench_pipeline --compare baseline.json       (flags regressions)
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import dlib
+import numpy as np
+
+import gaze_tracking
+from gaze_tracking import GazeTracking
+from gaze_tracking.calibration import Calibration
+from gaze_tracking.eye import Eye
+from gaze_tracking.logger import BinaryEventLogger, EventLogger, StreamingEventLogger
+from gaze_tracking.psp_metrics import PSPGazeMetrics
+from gaze_tracking.pupil import Pupil
+from benchmarks.synthetic import SyntheticFace
+
+CLIP = Path(__file__).parent / "fixtures" / "synthetic_session.avi"
+CLIP_SIZE = (320, 240) # the clip is SyntheticFace(320, 240, seed=0)
+MODEL = Path(gaze_tracking.__file__).parent / "trained_models" / "shape_predictor_68_face_landmarks.dat"
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput (calls/s) of a list of durations in seconds"""
+    ms = np.asarray(samples) * 1000
+    return dict(
+        n=len(ms),
+        mean_ms=float(ms.mean()),
+        p50_ms=float(np.percentile(ms, 50)),
+        p95_ms=float(np.percentile(ms, 95)),
+        p99_ms=float(np.percentile(ms, 99)),
+        throughput=float(1000 / ms.mean()) if ms.mean() > 0 else float("inf"),
+    )
+
+
+def measure(func, inputs):
+    """Calls func(*args) for every args of inputs and returns the summary of the durations"""
+    samples = []
+    for args in inputs:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def load_frames(source, nb_frames, width, height):
+    """Returns (frames, landmarks, decode timings) for the synthetic renderer or the clip"""
+    if source == "synthetic":
+        face = SyntheticFace(width, height)
+        rendered = [face.render(i) for i in range(nb_frames)]
+        return [f for f, _ in rendered], [l for _, l in rendered], None
+
+    face = SyntheticFace(*CLIP_SIZE)
+    capture = cv2.VideoCapture(str(CLIP))
+    nb_clip = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames, samples = [], []
+    while len(frames) < nb_frames:
+        start = time.perf_counter()
+        ret, frame = capture.read()
+        if not ret:
+            # loop over the clip until enough frames were decoded
+            if not frames:
+                raise IOError(f"cannot read {CLIP}")
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        samples.append(time.perf_counter() - start)
+        frames.append(frame)
+    capture.release()
+    nb_clip = nb_clip or len(frames)
+    return frames, [face.landmarks(i % nb_clip) for i in range(len(frames))], summarize(samples)
+
+
+def isolate(gray, landmarks, points):
+    eye = Eye.__new__(Eye)
+    eye._isolate(gray, landmarks, points)
+    return eye.frame
+
+
+def run(source, nb_frames, width, height):
+    frames, landmarks, decoding = load_frames(source, nb_frames, width, height)
+    stages = {}
+    skipped = {}
+    if decoding:
+        stages["decode"] = decoding
+
+    stages["grayscale"] = measure(lambda f: cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), [(f,) for f in frames])
+    grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+
+    detector = dlib.get_frontal_face_detector()
+    stages["face_detection"] = measure(detector, [(g,) for g in grays])
+
+    if MODEL.exists():
+        predictor = dlib.shape_predictor(str(MODEL))
+        boxes = []
+        for l in landmarks:
+            xs = [l.part(i).x for i in range(l.num_parts)]
+            ys = [l.part(i).y for i in range(l.num_parts)]
+            boxes.append(dlib.rectangle(min(xs), min(ys), max(xs), max(ys)))
+        stages["landmarks"] = measure(predictor, list(zip(grays, boxes)))
+    else:
+        skipped["landmarks"] = f"model not found at {MODEL}"
+
+    inputs = [(g, l, Eye.LEFT_EYE_POINTS) for g, l in zip(grays, landmarks)]
+    stages["eye_isolation"] = measure(isolate, inputs)
+    eyes = [isolate(*args) for args in inputs]
+
+    stages["filtering"] = measure(Pupil.filtering, [(e,) for e in eyes])
+    stages["calibration_frame"] = measure(Calibration.find_best_threshold, [(e,) for e in eyes])
+    thresholds = [Calibration.find_best_threshold(e) for e in eyes]
+    iris_frames = [Pupil.image_processing(e, t) for e, t in zip(eyes, thresholds)]
+    stages["contour_moments"] = measure(Pupil.centroid, [(i,) for i in iris_frames])
+    stages["pupil"] = measure(Pupil, list(zip(eyes, thresholds)))
+
+    # logging and metrics are fed with the pupil positions found above
+    samples = []
+    for i, (e, iris) in enumerate(zip(eyes, iris_frames)):
+        x, y = Pupil.centroid(iris)
+        h = x / max(e.shape[1] - 10, 1) if x is not None else None
+        v = y / max(e.shape[0] - 10, 1) if y is not None else None
+        samples.append((i / 30, h, v, False))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stages["log_csv"] = measure(EventLogger(os.path.join(tmp, "a.csv")).log_frame, samples)
+        stages["log_binary"] = measure(BinaryEventLogger(os.path.join(tmp, "a.pspg")).log_frame, samples)
+        with StreamingEventLogger(os.path.join(tmp, "b.csv")) as logger:
+            stages["log_streaming"] = measure(logger.log_frame, samples)
+
+        metrics = PSPGazeMetrics(None, logger=BinaryEventLogger(os.path.join(tmp, "b.pspg")), save_on_exit=False)
+        stages["metrics_feed"] = measure(metrics.feed, samples)
+
+        if MODEL.exists():
+            gaze = GazeTracking()
+            stages["refresh"] = measure(gaze.refresh, [(f,) for f in frames])
+            metrics = PSPGazeMetrics(gaze, logger=BinaryEventLogger(os.path.join(tmp, "c.pspg")),
+                                     save_on_exit=False)
+            stages["metrics_update"] = measure(metrics.update, [(f, i / 30) for i, f in enumerate(frames)])
+        else:
+            skipped["refresh"] = skipped["metrics_update"] = f"model not found at {MODEL}"
+
+    height, width = frames[0].shape[:2]
+    meta = dict(
+        source=source,
+        frames=len(frames),
+        resolution=f"{width}x{height}",
+        python=platform.python_version(),
+        numpy=np.__version__,
+        opencv=cv2.__version__,
+        dlib=getattr(dlib, "__version__", None),
+        machine=platform.machine(),
+        processor=platform.processor(),
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    return dict(meta=meta, stages=stages, skipped=skipped)
+
+
+def compare(results, baseline, tolerance):
+    """Prints the p50 of every stage against the baseline and returns the regressed stages"""
+    regressions = []
+    for key in ("source", "resolution", "frames"):
+        if baseline["meta"].get(key) != results["meta"][key]:
+            print(f"[BENCH] warning: baseline {key} is {baseline['meta'].get(key)}, not {results['meta'][key]}")
+    print(f"\n{'stage':<20}{'baseline p50':>14}{'p50':>10}{'ratio':>8}")
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            print(f"{name:<20}{'-':>14}{stage['p50_ms']:>10.3f}")
+            continue
+        ratio = stage["p50_ms"] / base["p50_ms"] if base["p50_ms"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<20}{base['p50_ms']:>14.3f}{stage['p50_ms']:>10.3f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmark of the gaze pipeline")
+    parser.add_argument("--source", choices=("synthetic", "clip"), default="synthetic")
+    parser.add_argument("--frames", type=int, default=300, help="number of frames per stage")
+    parser.add_argument("--resolution", default="640x480", help="synthetic frame size, WxH")
+    parser.add_argument("-o", "--output", help="write the results as json")
+    parser.add_argument("--compare", help="baseline json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown (0.15 = 15%%)")
+    parser.add_argument("--make-clip", action="store_true", help="(re)generate the checked-in clip and exit")
+    args = parser.parse_args()
+
+    if args.make_clip:
+        CLIP.parent.mkdir(parents=True, exist_ok=True)
+        SyntheticFace(*CLIP_SIZE).write_clip(CLIP, 90)
+        print(f"[BENCH] wrote {CLIP}")
+        return
+
+    width, height = (int(x) for x in args.resolution.lower().split("x"))
+    results = run(args.source, args.frames, width, height)
+
+    print(f"\n{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<20}{stage['p50_ms']:>10.3f}{stage['p95_ms']:>10.3f}{stage['p99_ms']:>10.3f}"
+              f"{stage['throughput']:>12.0f}")
+    for name, reason in results["skipped"].items():
+        print(f"{name:<20}skipped: {reason}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[BENCH] wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n[BENCH] regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#accuracy and speed of the fast pupil mode against the accurate (default) one
+#
+#   python -m benchmarks.compare_pupil_modes                     (checked-in clip, with ground truth)
+#   python -m benchmarks.compare_pupil_modes --video session.mp4 (recorded data, needs the landmark model)
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from gaze_tracking.calibration import Calibration
+from gaze_tracking.eye import Eye
+from gaze_tracking.pupil import Pupil
+from benchmarks.bench_pipeline import CLIP, CLIP_SIZE
+from benchmarks.synthetic import SyntheticFace
+
+
+def clip_eyes(nb_frames):
+    """Yields (eye_frame, origin, true_center) for both eyes of the checked-in clip"""
+    face = SyntheticFace(*CLIP_SIZE)
+    capture = cv2.VideoCapture(str(CLIP))
+    try:
+        for index in range(nb_frames):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            landmarks = face.landmarks(index)
+            for points, center in zip((Eye.LEFT_EYE_POINTS, Eye.RIGHT_EYE_POINTS), face.iris_centers(index)):
+                eye = Eye.__new__(Eye)
+                eye._isolate(gray, landmarks, points)
+                yield eye.frame, eye.origin, center
+    finally:
+        capture.release()
+
+
+def video_eyes(path, nb_frames):
+    """Yields (eye_frame, origin, None) for both eyes of a recorded video"""
+    from gaze_tracking import GazeTracking
+
+    gaze = GazeTracking()
+    capture = cv2.VideoCapture(path)
+    try:
+        for _ in range(nb_frames):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            gaze.refresh(frame)
+            for eye in (gaze.eye_left, gaze.eye_right):
+                if eye is not None:
+                    yield eye.frame, eye.origin, None
+    finally:
+        capture.release()
+
+
+def run_mode(eyes, mode):
+    """Calibrates then locates the pupil of every eye frame with a mode.
+
+    Returns:
+        (positions, durations): frame coordinates (or None) and seconds per eye frame
+    """
+    calibration = Calibration(mode)
+    positions, durations = [], []
+    for index, (frame, origin, _) in enumerate(eyes):
+        side = index % 2
+        start = time.perf_counter()
+        if not calibration.is_complete():
+            calibration.evaluate(frame, side)
+        pupil = Pupil(frame, calibration.threshold(side), mode)
+        durations.append(time.perf_counter() - start)
+        positions.append(None if pupil.x is None else (origin[0] + pupil.x, origin[1] + pupil.y))
+    return positions, durations
+
+
+def distances(a, b):
+    """Pixel distances between the pairs of positions that are both located"""
+    return np.array([np.hypot(p[0] - q[0], p[1] - q[1]) for p, q in zip(a, b) if p is not None and q is not None])
+
+
+def describe(values):
+    if not len(values):
+        return None
+    return dict(mean=float(values.mean()), p50=float(np.percentile(values, 50)),
+                p95=float(np.percentile(values, 95)), max=float(values.max()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fast and accurate pupil modes")
+    parser.add_argument("--video", help="recorded video (default: checked-in synthetic clip)")
+    parser.add_argument("--frames", type=int, default=90)
+    parser.add_argument("-o", "--output", help="write the report as json")
+    args = parser.parse_args()
+
+    eyes = list(video_eyes(args.video, args.frames) if args.video else clip_eyes(args.frames))
+    truth = [center for _, _, center in eyes]
+    results = {mode: run_mode(eyes, mode) for mode in Pupil.MODES}
+    accurate, fast = results[Pupil.ACCURATE][0], results[Pupil.FAST][0]
+
+    report = dict(
+        source=args.video or str(CLIP),
+        eye_frames=len(eyes),
+        located={mode: sum(p is not None for p in results[mode][0]) for mode in Pupil.MODES},
+        located_agreement=float(np.mean([(a is None) == (f is None) for a, f in zip(accurate, fast)])),
+        fast_vs_accurate_px=describe(distances(fast, accurate)),
+        ms_per_eye={mode: float(np.mean(results[mode][1]) * 1000) for mode in Pupil.MODES},
+    )
+    if not args.video:
+        report["error_vs_truth_px"] = {mode: describe(distances(results[mode][0], truth)) for mode in Pupil.MODES}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
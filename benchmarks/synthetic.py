@@ -0,0 +1,136 @@
+from __future__ import division
+import math
+import numpy as np
+import cv2
+
+
+class _Point(object):
+    __slots__ = ("x", "y")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class SyntheticLandmarks(object):
+    """
+    68 facial landmarks with the interface of dlib.full_object_detection
+    that Eye needs (part(i).x, part(i).y, num_parts)
+    """
+
+    def __init__(self, points):
+        self._points = [_Point(int(x), int(y)) for x, y in points]
+        self.num_parts = len(self._points)
+
+    def part(self, index):
+        return self._points[index]
+
+
+class SyntheticFace(object):
+    """
+    This class renders deterministic frames of a face looking around,
+    with the landmarks of each frame, so the pipeline stages can be
+    benchmarked without a webcam.
+    """
+
+    def __init__(self, width=640, height=480, seed=0):
+        self.width = width
+        self.height = height
+        self.seed = seed
+
+        # face size and position scale with the frame
+        self.face_w = int(min(width, height) * 0.45)
+        self.face_h = int(self.face_w * 1.3)
+        self.cx = width // 2
+        self.cy = height // 2
+        self.eye_w = self.face_w // 5
+        self.eye_h = self.eye_w // 2
+
+        rng = np.random.RandomState(seed)
+        self._noise = rng.randint(0, 4, (height, width, 1)).astype(np.uint8)
+
+    def _gaze(self, index):
+        """Returns the (gx, gy) gaze offset, between -1 and 1, of a frame:
+        slow pursuit with a saccade every 45 frames and a blink every 90"""
+        phase = index / 30
+        gx = 0.5 * math.sin(phase) + (0.4 if (index // 45) % 2 else -0.4)
+        gy = 0.4 * math.cos(phase * 0.7)
+        return max(-1, min(1, gx)), max(-1, min(1, gy))
+
+    def _blinking(self, index):
+        return index % 90 in (88, 89)
+
+    def _eye_points(self, cx, cy, closed):
+        """Six landmarks of an eye in the Multi-PIE order: outer/inner corner,
+        two upper points, inner/outer corner, two lower points"""
+        w, h = self.eye_w, (1 if closed else self.eye_h)
+        return [(cx - w / 2, cy), (cx - w / 6, cy - h / 2), (cx + w / 6, cy - h / 2),
+                (cx + w / 2, cy), (cx + w / 6, cy + h / 2), (cx - w / 6, cy + h / 2)]
+
+    def landmarks(self, index):
+        """Returns the SyntheticLandmarks of a frame"""
+        closed = self._blinking(index)
+        eye_y = self.cy - self.face_h // 8
+        left_x = self.cx - self.face_w // 4
+        right_x = self.cx + self.face_w // 4
+
+        points = []
+        # 0-16 jaw, 17-26 eyebrows, 27-35 nose: coarse outline around the face
+        for i in range(17):
+            angle = math.pi * i / 16
+            points.append((self.cx - math.cos(angle) * self.face_w / 2, self.cy + math.sin(angle) * self.face_h / 2))
+        for i in range(10):
+            points.append((self.cx - self.face_w * 0.4 + i * self.face_w * 0.8 / 9, eye_y - self.eye_h * 1.5))
+        for i in range(9):
+            points.append((self.cx + (i - 4) * self.eye_w / 8, self.cy + i * self.face_h / 40))
+        # 36-41 left eye, 42-47 right eye
+        points += self._eye_points(left_x, eye_y, closed)
+        points += self._eye_points(right_x, eye_y, closed)
+        # 48-67 mouth
+        mouth_y = self.cy + self.face_h // 4
+        for i in range(20):
+            angle = 2 * math.pi * i / 20
+            points.append((self.cx + math.cos(angle) * self.face_w / 6, mouth_y + math.sin(angle) * self.face_h / 20))
+        return SyntheticLandmarks(points)
+
+    def iris_centers(self, index):
+        """Returns the true (x, y) iris center of the left and right eyes in
+        the frame, None for an eye that is closed"""
+        if self._blinking(index):
+            return [None, None]
+        landmarks = self.landmarks(index)
+        gx, gy = self._gaze(index)
+        centers = []
+        for first in (36, 42):
+            xs = [landmarks.part(i).x for i in range(first, first + 6)]
+            ys = [landmarks.part(i).y for i in range(first, first + 6)]
+            centers.append((int(sum(xs) / 6 + gx * self.eye_w / 4), int(sum(ys) / 6 + gy * self.eye_h / 6)))
+        return centers
+
+    def render(self, index):
+        """Returns the (frame, landmarks) of a frame, frame being a BGR image"""
+        frame = np.full((self.height, self.width, 3), 90, np.uint8)
+        frame += self._noise
+        cv2.ellipse(frame, (self.cx, self.cy), (self.face_w // 2, self.face_h // 2), 0, 0, 360, (150, 170, 200), -1)
+
+        landmarks = self.landmarks(index)
+        centers = self.iris_centers(index)
+        for first, center in zip((36, 42), centers):
+            eye = np.array([(landmarks.part(i).x, landmarks.part(i).y) for i in range(first, first + 6)], np.int32)
+            cv2.fillPoly(frame, [eye], (235, 235, 235))
+            if center is not None:
+                cv2.circle(frame, center, max(self.eye_h // 2, 2), (40, 30, 20), -1)
+                cv2.circle(frame, center, max(self.eye_h // 5, 1), (5, 5, 5), -1)
+            cv2.polylines(frame, [eye], True, (60, 70, 90), 1)
+
+        return frame, landmarks
+
+    def write_clip(self, path, nb_frames, fps=30, quality=50):
+        """Writes nb_frames rendered frames to a MJPG video file"""
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (self.width, self.height))
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+        try:
+            for index in range(nb_frames):
+                writer.write(self.render(index)[0])
+        finally:
+            writer.release()
@@ -1,47 +1,55 @@
 import cv2
 from gaze_tracking import GazeTracking
+from gaze_tracking.calibration import Calibration, profile_path
 from gaze_tracking.psp_metrics import PSPGazeMetrics
-from gaze_tracking.logger import EventLogger
+from gaze_tracking.logger import StreamingEventLogger
+from gaze_tracking.pipeline import GazePipeline
 
-gaze   = GazeTracking()
-logger = EventLogger("session_1.csv")
-metrics = PSPGazeMetrics(gaze, logger=logger, debug=True)   # set debug=False to stop console prints
+profile = profile_path("profiles", "subject_1")             # a returning subject starts already calibrated
+gaze   = GazeTracking(calibration=Calibration.from_profile(profile, adapt_rate=0.05))
+logger = StreamingEventLogger("session_1.csv")              # rows are written to disk as the session goes
+metrics = PSPGazeMetrics(gaze, logger=logger, debug=True, save_on_exit=False)   # set debug=False to stop console prints
 webcam  = cv2.VideoCapture(0)
 
+
+def show(frame, snapshot):
+    # runs in the main thread with the annotated frame and the snapshot computed for it
+    h = snapshot["h_ratio"]
+
+    # simple gaze-direction text
+    text = ("Blinking"    if snapshot["blink"] else
+            "Look right"  if h is not None and h <= 0.35 else
+            "Look left"   if h is not None and h >= 0.65 else
+            "Look centre")
+
+    cv2.putText(frame, text, (90, 60),
+                cv2.FONT_HERSHEY_DUPLEX, 1.6, (147, 58, 31), 2)
+
+    # overlay last detected saccades
+    if snapshot["last_horiz_saccade"]:
+        cv2.putText(frame, "H-saccade!", (90, 100),
+                    cv2.FONT_HERSHEY_DUPLEX, 0.9, (0, 0, 255), 1)
+    if snapshot["last_vert_saccade"]:
+        cv2.putText(frame, "V-saccade!", (90, 130),
+                    cv2.FONT_HERSHEY_DUPLEX, 0.9, (255, 0, 0), 1)
+
+    cv2.imshow("PSP-Gaze Demo", frame)
+    return cv2.waitKey(1) & 0xFF != 27   # ESC to quit
+
+
+# capture, analysis and display run in separate stages, a slow frame is dropped instead of stalling the camera
+pipeline = GazePipeline(webcam, metrics, sink=show, drop_policy="oldest")
+
 try:
-    while True:
-        ret, frame = webcam.read()
-        if not ret:
-            break
-
-        snapshot = metrics.update(frame)          
-        frame    = gaze.annotated_frame()         
-
-        # simple gaze-direction text
-        text = ("Blinking"   if gaze.is_blinking() else
-                "Look right" if gaze.is_right()    else
-                "Look left"  if gaze.is_left()     else
-                "Look centre")
-
-        cv2.putText(frame, text, (90, 60),
-                    cv2.FONT_HERSHEY_DUPLEX, 1.6, (147, 58, 31), 2)
-
-        # overlay last detected saccades
-        if snapshot["last_horiz_saccade"]:
-            cv2.putText(frame, "H-saccade!", (90, 100),
-                        cv2.FONT_HERSHEY_DUPLEX, 0.9, (0, 0, 255), 1)
-        if snapshot["last_vert_saccade"]:
-            cv2.putText(frame, "V-saccade!", (90, 130),
-                        cv2.FONT_HERSHEY_DUPLEX, 0.9, (255, 0, 0), 1)
-
-        cv2.imshow("PSP-Gaze Demo", frame)
-        if cv2.waitKey(1) & 0xFF == 27:   # ESC to quit
-            break
+    pipeline.run()
 
 except KeyboardInterrupt:
     pass # used for CTRL + C
 
 finally:
+    pipeline.stop()
     logger.to_csv()                     
+    gaze.calibration.save(profile)
     webcam.release()
     cv2.destroyAllWindows()
+    print(f"[PIPELINE] {pipeline.stats()}")
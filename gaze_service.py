@@ -0,0 +1,36 @@
+#local gaze analysis server shared by the apps of a workstation
+#
+#   python gaze_service.py --unix /tmp/gaze.sock -j 4
+#
+#clients connect with gaze_tracking.service.GazeClient("/tmp/gaze.sock")
+
+import argparse
+import asyncio
+import os
+from gaze_tracking.service import GazeService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PSP gaze analysis to local apps")
+    parser.add_argument("--unix", help="unix socket path (default: tcp on localhost)")
+    parser.add_argument("--port", type=int, default=8765, help="localhost tcp port")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--track-face", action="store_true", help="track the face box between frames")
+    parser.add_argument("--detection-scale", type=float, default=1.0, help="scale of the frame used for face detection")
+    parser.add_argument("--max-pending", type=int, default=32, help="frames queued per worker before clients wait")
+    args = parser.parse_args()
+
+    service = GazeService(workers=args.workers, max_pending=args.max_pending,
+                          gaze_options=dict(track_face=args.track_face, detection_scale=args.detection_scale))
+    print(f"[SERVICE] {args.workers} workers on {args.unix or f'127.0.0.1:{args.port}'}")
+    try:
+        asyncio.run(service.serve(path=args.unix, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == "__main__":
+    main()
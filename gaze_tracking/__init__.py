@@ -1 +1 @@
-from .gaze_tracking import GazeTracking
+from .gaze_tracking import GazeTracking, GazeFrame
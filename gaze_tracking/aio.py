@@ -0,0 +1,80 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# marks the end of the source in the frame queue
+_END = object()
+
+
+async def stream(metrics, source, window=4, close_logger=True):
+    """Asynchronous iterator over the snapshots of PSPGazeMetrics.update(),
+    one per frame of the source, in frame order:
+
+        async for snapshot in metrics.stream(cv2.VideoCapture(0)):
+            ...
+
+    Capture and analysis run in two single-thread executors owned by the
+    iterator, so the event loop is never blocked and one loop can drive
+    several cameras. At most `window` frames wait between capture and
+    analysis: when analysis is slower, capture waits. Breaking out of the
+    loop or cancelling the task stops capture, waits for the frame being
+    analyzed and saves the logger. After a break, the event loop runs this
+    cleanup shortly afterwards; use contextlib.aclosing() to have it done
+    when the block exits:
+
+        async with contextlib.aclosing(metrics.stream(camera)) as snapshots:
+            async for snapshot in snapshots:
+                ...
+
+    Arguments:
+        metrics (PSPGazeMetrics): Metrics updated with every frame
+        source: Object with a blocking read() returning (ret, frame), like
+            cv2.VideoCapture, or an async iterable of frames
+        window (int): Maximum number of captured frames waiting for analysis
+        close_logger (bool): Save the metrics logger when the stream ends (with
+            PSPGazeMetrics.close(), once)
+    """
+    loop = asyncio.get_running_loop()
+    capture_pool = ThreadPoolExecutor(1, thread_name_prefix="gaze-capture")
+    analysis_pool = ThreadPoolExecutor(1, thread_name_prefix="gaze-analysis")
+    frames = asyncio.Queue(maxsize=window)
+
+    async def capture():
+        try:
+            if hasattr(source, "__aiter__"):
+                async for frame in source:
+                    await frames.put((time.time(), frame))
+            else:
+                while True:
+                    ret, frame = await loop.run_in_executor(capture_pool, source.read)
+                    # frames are timestamped when grabbed, not when analyzed
+                    t = time.time()
+                    if not ret:
+                        break
+                    await frames.put((t, frame))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await frames.put(e)
+            return
+        await frames.put(_END)
+
+    capture_task = loop.create_task(capture())
+    try:
+        while True:
+            item = await frames.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            t, frame = item
+            yield await loop.run_in_executor(analysis_pool, metrics.update, frame, t)
+    finally:
+        capture_task.cancel()
+        await asyncio.gather(capture_task, return_exceptions=True)
+        # waits for a read() or update() still running in the executors
+        await loop.run_in_executor(None, capture_pool.shutdown)
+        await loop.run_in_executor(None, analysis_pool.shutdown)
+        if close_logger:
+            # through the metrics, so the log isn't saved again at exit
+            await loop.run_in_executor(None, metrics.close, True)
@@ -1,5 +1,9 @@
 from __future__ import division
+import json
+import os
+import re
 import cv2
+import numpy as np
 from .pupil import Pupil
 
 
@@ -9,14 +13,55 @@ class Calibration(object):
     best binarization threshold value for the person and the webcam.
     """
 
-    def __init__(self):
+    # candidate thresholds tried for each calibration frame
+    THRESHOLDS = range(5, 100, 5)
+
+    # format of the profile files written by save()
+    PROFILE_VERSION = 1
+
+    def __init__(self, pupil_mode=Pupil.ACCURATE, adapt_rate=0.0, adapt_interval=30):
+        """
+        Arguments:
+            pupil_mode (str): Pupil detection mode the thresholds are computed for
+            adapt_rate (float): Weight of a new threshold once the calibration is
+                complete (0: the thresholds don't change anymore)
+            adapt_interval (int): Frames of an eye between two adaptation steps
+        """
+        if pupil_mode not in Pupil.MODES:
+            raise ValueError(f"pupil_mode must be one of {Pupil.MODES}, not {pupil_mode!r}")
+        self.pupil_mode = pupil_mode
         self.nb_frames = 20
-        self.thresholds_left = []
-        self.thresholds_right = []
+        self.adapt_rate = adapt_rate
+        self.adapt_interval = adapt_interval
+
+        # running sums of the thresholds found for each eye (left, right) during the warm-up,
+        # then their slowly adapted value
+        self.sums = [0, 0]
+        self.counts = [0, 0]
+        self.adapted = [None, None]
+        self._since_adapted = [0, 0]
 
     def is_complete(self):
         """Returns true if the calibration is completed"""
-        return len(self.thresholds_left) >= self.nb_frames and len(self.thresholds_right) >= self.nb_frames
+        return self.counts[0] >= self.nb_frames and self.counts[1] >= self.nb_frames
+
+    def needs_evaluation(self, side):
+        """Returns true if the next frame of an eye should be passed to
+        evaluate(): always until the calibration is complete, then every
+        adapt_interval frames if adaptation is on.
+
+        Argument:
+            side: Indicates whether it's the left eye (0) or the right eye (1)
+        """
+        if not self.is_complete():
+            return True
+        if not self.adapt_rate:
+            return False
+        self._since_adapted[side] += 1
+        if self._since_adapted[side] < self.adapt_interval:
+            return False
+        self._since_adapted[side] = 0
+        return True
 
     def threshold(self, side):
         """Returns the threshold value for the given eye.
@@ -24,10 +69,9 @@ class Calibration(object):
         Argument:
             side: Indicates whether it's the left eye (0) or the right eye (1)
         """
-        if side == 0:
-            return int(sum(self.thresholds_left) / len(self.thresholds_left))
-        elif side == 1:
-            return int(sum(self.thresholds_right) / len(self.thresholds_right))
+        if self.adapted[side] is not None:
+            return int(self.adapted[side])
+        return int(self.sums[side] / self.counts[side])
 
     @staticmethod
     def iris_size(frame):
@@ -44,22 +88,30 @@ class Calibration(object):
         return nb_blacks / nb_pixels
 
     @staticmethod
-    def find_best_threshold(eye_frame):
+    def find_best_threshold(eye_frame, thresholds=None, mode=Pupil.ACCURATE):
         """Calculates the optimal threshold to binarize the
         frame for the given eye.
 
-        Argument:
+        The frame is filtered once, then the iris size for every candidate
+        threshold is read from the cumulative histogram of the region used
+        by iris_size(): a pixel is black once binarized iff it's <= threshold.
+
+        Arguments:
             eye_frame (numpy.ndarray): Frame of the eye to be analyzed
+            thresholds (iterable): Integer thresholds to try (default: THRESHOLDS)
+            mode (str): Pupil detection mode, see Pupil.filtering()
         """
         average_iris_size = 0.48
-        trials = {}
+        if thresholds is None:
+            thresholds = Calibration.THRESHOLDS
+        thresholds = np.asarray(thresholds, dtype=np.int64)
 
-        for threshold in range(5, 100, 5):
-            iris_frame = Pupil.image_processing(eye_frame, threshold)
-            trials[threshold] = Calibration.iris_size(iris_frame)
+        frame = Pupil.filtering(eye_frame, mode)[5:-5, 5:-5]
+        nb_blacks = np.cumsum(np.bincount(frame.ravel(), minlength=256))
+        iris_sizes = nb_blacks[np.clip(thresholds, 0, 255)] / frame.size
 
-        best_threshold, iris_size = min(trials.items(), key=(lambda p: abs(p[1] - average_iris_size)))
-        return best_threshold
+        best = np.argmin(np.abs(iris_sizes - average_iris_size))
+        return int(thresholds[best])
 
     def evaluate(self, eye_frame, side):
         """Improves calibration by taking into consideration the
@@ -69,9 +121,69 @@ class Calibration(object):
             eye_frame (numpy.ndarray): Frame of the eye
             side: Indicates whether it's the left eye (0) or the right eye (1)
         """
-        threshold = self.find_best_threshold(eye_frame)
+        threshold = self.find_best_threshold(eye_frame, mode=self.pupil_mode)
 
-        if side == 0:
-            self.thresholds_left.append(threshold)
-        elif side == 1:
-            self.thresholds_right.append(threshold)
+        if not self.is_complete():
+            self.sums[side] += threshold
+            self.counts[side] += 1
+        else:
+            # slow adaptation (e.g. lighting changes) of the calibrated value
+            current = self.adapted[side]
+            if current is None:
+                current = self.sums[side] / self.counts[side]
+            self.adapted[side] = current + self.adapt_rate * (threshold - current)
+
+    def save(self, path):
+        """Saves the calibration to a profile file, so a later session of the
+        same subject and camera starts calibrated (see from_profile())
+
+        Argument:
+            path (str): Profile file (json)
+        """
+        profile = dict(version=self.PROFILE_VERSION, pupil_mode=self.pupil_mode, nb_frames=self.nb_frames,
+                       sums=self.sums, counts=self.counts, adapted=self.adapted)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(profile, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_profile(cls, path, pupil_mode=Pupil.ACCURATE, adapt_rate=0.0, adapt_interval=30):
+        """Returns the calibration saved in a profile file, or a new one if
+        the file doesn't exist yet (first session of the subject)
+
+        Arguments:
+            path (str): Profile file written by save()
+            pupil_mode (str): Pupil detection mode, must be the one of the profile
+            adapt_rate (float): See __init__()
+            adapt_interval (int): See __init__()
+        """
+        calibration = cls(pupil_mode, adapt_rate, adapt_interval)
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except FileNotFoundError:
+            return calibration
+
+        if profile.get("version") != cls.PROFILE_VERSION:
+            raise ValueError(f"{path} has unsupported profile version {profile.get('version')}")
+        if profile["pupil_mode"] != pupil_mode:
+            raise ValueError(f"{path} was calibrated for the {profile['pupil_mode']!r} pupil mode, not {pupil_mode!r}")
+        calibration.nb_frames = profile["nb_frames"]
+        calibration.sums = list(profile["sums"])
+        calibration.counts = list(profile["counts"])
+        calibration.adapted = list(profile["adapted"])
+        return calibration
+
+
+def profile_path(directory, subject, camera="default"):
+    """Returns the path of the calibration profile of a subject with a camera
+
+    Arguments:
+        directory (str): Folder of the profiles
+        subject (str): Subject identifier
+        camera (str): Camera identifier
+    """
+    name = "-".join(re.sub(r"[^A-Za-z0-9_.]+", "_", str(part)) for part in (subject, camera))
+    return os.path.join(directory, f"{name}.json")
@@ -1,4 +1,5 @@
 import math
+import threading
 import numpy as np
 import cv2
 from .pupil import Pupil
@@ -13,6 +14,9 @@ class Eye(object):
     LEFT_EYE_POINTS = [36, 37, 38, 39, 40, 41]
     RIGHT_EYE_POINTS = [42, 43, 44, 45, 46, 47]
 
+    # per-thread scratch memory for the eye mask, reused across frames
+    _scratch = threading.local()
+
     def __init__(self, original_frame, landmarks, side, calibration):
         self.frame = None
         self.origin = None
@@ -46,13 +50,6 @@ class Eye(object):
         region = region.astype(np.int32)
         self.landmark_points = region
 
-        # Applying a mask to get only the eye
-        height, width = frame.shape[:2]
-        black_frame = np.zeros((height, width), np.uint8)
-        mask = np.full((height, width), 255, np.uint8)
-        cv2.fillPoly(mask, [region], (0, 0, 0))
-        eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
-
         # Cropping on the eye
         margin = 5
         min_x = np.min(region[:, 0]) - margin
@@ -60,12 +57,46 @@ class Eye(object):
         min_y = np.min(region[:, 1]) - margin
         max_y = np.max(region[:, 1]) + margin
 
-        self.frame = eye[min_y:max_y, min_x:max_x]
+        if min_x >= 0 and min_y >= 0:
+            # Applying a mask to the cropped region only
+            eye = frame[min_y:max_y, min_x:max_x].copy()
+            height, width = eye.shape[:2]
+            if height and width:
+                mask = self._scratch_mask(height, width)
+                mask.fill(255)
+                cv2.fillPoly(mask, [region], (0, 0, 0), offset=(-int(min_x), -int(min_y)))
+                cv2.bitwise_or(eye, mask, dst=eye)
+            self.frame = eye
+        else:
+            # Negative bounds wrap around when slicing: keep the full frame path
+            height, width = frame.shape[:2]
+            black_frame = np.zeros((height, width), np.uint8)
+            mask = np.full((height, width), 255, np.uint8)
+            cv2.fillPoly(mask, [region], (0, 0, 0))
+            eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
+            self.frame = eye[min_y:max_y, min_x:max_x]
+
         self.origin = (min_x, min_y)
 
         height, width = self.frame.shape[:2]
         self.center = (width / 2, height / 2)
 
+    @classmethod
+    def _scratch_mask(cls, height, width):
+        """Returns a (height, width) view on the scratch buffer of the current thread,
+        growing the buffer if it's too small.
+
+        Arguments:
+            height (int): Height of the mask
+            width (int): Width of the mask
+        """
+        size = height * width
+        buffer = getattr(cls._scratch, "buffer", None)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(max(size, 4096), np.uint8)
+            cls._scratch.buffer = buffer
+        return buffer[:size].reshape(height, width)
+
     def _blinking_ratio(self, landmarks, points):
         """Calculates a ratio that can indicate whether an eye is closed or not.
         It's the division of the width of the eye, by its height.
@@ -112,8 +143,8 @@ class Eye(object):
         self.blinking = self._blinking_ratio(landmarks, points)
         self._isolate(original_frame, landmarks, points)
 
-        if not calibration.is_complete():
+        if calibration.needs_evaluation(side):
             calibration.evaluate(self.frame, side)
 
         threshold = calibration.threshold(side)
-        self.pupil = Pupil(self.frame, threshold)
+        self.pupil = Pupil(self.frame, threshold, calibration.pupil_mode)
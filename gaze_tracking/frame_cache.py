@@ -0,0 +1,192 @@
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+from .gaze_tracking import GazeFrame, NO_GAZE
+
+# what GazeTracking measured on one frame of a video, enough to rebuild its GazeFrame
+# without running dlib again. Sides are (left, right); a pupil or blinking ratio
+# that wasn't measured is NaN.
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),                       # video timestamp (s)
+    ("face", "?"),
+    ("landmarks", "<i4", (68, 2)),
+    ("origin", "<i4", (2, 2)),          # eye frame origin in the frame
+    ("size", "<i4", (2, 2)),            # eye frame (width, height)
+    ("pupil", "<f8", (2, 2)),           # pupil (x, y) in the eye frame
+    ("blink", "<f8", (2,)),             # blinking ratio
+])
+
+
+def frame_record(gaze, t):
+    """Returns the record of the frame GazeTracking just analyzed
+
+    Arguments:
+        gaze (GazeTracking): Tracker refreshed with the frame
+        t (float): Timestamp of the frame
+    """
+    record = np.zeros((), RECORD_DTYPE)
+    record["t"] = t
+    record["pupil"] = np.nan
+    record["blink"] = np.nan
+    if gaze.landmarks is None:
+        return record
+
+    record["face"] = True
+    landmarks = gaze.landmarks
+    record["landmarks"] = [(landmarks.part(i).x, landmarks.part(i).y) for i in range(landmarks.num_parts)]
+    for side, eye in enumerate((gaze.eye_left, gaze.eye_right)):
+        if eye is None or eye.frame is None:
+            continue
+        record["origin"][side] = eye.origin
+        record["size"][side] = (eye.frame.shape[1], eye.frame.shape[0])
+        if eye.pupil is not None and eye.pupil.x is not None:
+            record["pupil"][side] = (eye.pupil.x, eye.pupil.y)
+        if eye.blinking is not None:
+            record["blink"][side] = eye.blinking
+    return record
+
+
+def record_gaze_frame(record):
+    """Rebuilds the GazeFrame of a record, equal to the one refresh() returned"""
+    if not record["face"]:
+        return NO_GAZE
+    pupils = [None if np.isnan(x) else (float(x), float(y)) for x, y in record["pupil"]]
+    blinks = [None if np.isnan(ratio) else float(ratio) for ratio in record["blink"]]
+    centers = [(width / 2, height / 2) for width, height in record["size"].tolist()]
+    return GazeFrame.from_measures(record["origin"].tolist(), centers, pupils, blinks)
+
+
+# state an option object starts the analysis from, keyed on top of its constructor parameters
+_START_STATE = {"Calibration": ("nb_frames", "sums", "counts", "adapted")}
+
+
+def _settings(value):
+    # objects in the options (e.g. an AdaptiveScheduler, a Calibration) are keyed by the parameters they
+    # were built with, and a calibration by the thresholds it starts from (e.g. a loaded profile).
+    # Runtime counters are left out: the key doesn't change once the object was used.
+    names = [name for name in inspect.signature(type(value)).parameters if hasattr(value, name)]
+    names += _START_STATE.get(type(value).__name__, ())
+    return [type(value).__name__, {name: getattr(value, name) for name in names}]
+
+
+class FrameCache(object):
+    """
+    This class keeps the per-frame records of analyzed videos on disk, so a
+    recorded session can be re-analyzed (e.g. to tune the PSPGazeMetrics
+    thresholds) without running face detection, landmarks and pupil
+    detection again.
+
+    An entry holds the records of every frame of a video for one pipeline
+    config, in a .npy file named after the hash of the video content and
+    the hash of the config. When the files exceed max_bytes, the least
+    recently used ones are removed.
+    """
+
+    # bumped when the records or the analysis change
+    VERSION = 2
+
+    def __init__(self, directory, max_bytes=2 << 30):
+        """
+        Arguments:
+            directory (str): Folder of the cache files, created if needed
+            max_bytes (int): Size of the cache above which entries are evicted
+        """
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._hashes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def video_hash(self, path, block_size=1 << 20):
+        """Returns the sha1 of a video file, remembered while the file is unchanged"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._hashes.get(key)
+        if digest is None:
+            sha = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    sha.update(block)
+            digest = self._hashes[key] = sha.hexdigest()
+        return digest
+
+    @classmethod
+    def config_hash(cls, gaze_options, **settings):
+        """Returns the hash of the pipeline config the records depend on
+
+        Arguments:
+            gaze_options (dict): Keyword arguments of GazeTracking
+            settings: Other settings that change the records (calibration, chunking...)
+        """
+        options = {k: v for k, v in gaze_options.items() if k != "instrumentation"}
+        model_path = options.pop("model_path", None)
+        if model_path is not None:
+            options["model"] = [os.path.basename(model_path), os.path.getsize(model_path)]
+        config = dict(version=cls.VERSION, gaze=options, **settings)
+        text = json.dumps(config, sort_keys=True, default=_settings)
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+    def path(self, video_hash, config_hash):
+        return os.path.join(self.directory, f"{video_hash}-{config_hash}.npy")
+
+    def load(self, video_hash, config_hash):
+        """Returns the records of a video (memory mapped), or None on a miss"""
+        path = self.path(video_hash, config_hash)
+        try:
+            records = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        if records.dtype != RECORD_DTYPE:
+            self.misses += 1
+            return None
+        # the access time drives the eviction
+        os.utime(path)
+        self.hits += 1
+        return records
+
+    def store(self, video_hash, config_hash, records):
+        """Writes the records of a video, then evicts entries if the cache is too big"""
+        path = self.path(video_hash, config_hash)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(records, RECORD_DTYPE))
+        os.replace(tmp, path)
+        self.evict(keep=path)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the cache fits in max_bytes
+
+        Argument:
+            keep (str): Path of an entry never removed (the one just written)
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            self.evicted += 1
+
+    def stats(self):
+        entries = self._entries()
+        return dict(hits=self.hits, misses=self.misses, evicted=self.evicted,
+                    entries=len(entries), bytes=sum(size for _, size, _ in entries))
@@ -0,0 +1,284 @@
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b"PSPR"
+
+# start of the shared block, describes the frames so another process can attach by name
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("slots", "<u4"),
+    ("ndim", "<u4"),
+    ("shape", "<u4", (3,)),
+    ("dtype", "S8"),
+    ("head", "<i8"),    # sequence number of the last published frame, -1 if none
+])
+
+# per slot: sequence number of the frame it holds (-1 while it's being written) and capture time
+SLOT_DTYPE = np.dtype([("seq", "<i8"), ("t", "<f8")])
+
+_ALIGN = 64
+
+# attach() swaps resource_tracker.register on Python < 3.13, one attach at a time
+_attach_lock = threading.Lock()
+
+
+def _aligned(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _view(buf, dtype, shape, offset=0):
+    # array over part of the block. frombuffer keeps an export of the buffer for as long as the
+    # array lives, so closing the block under a live view raises BufferError instead of unmapping it
+    return np.frombuffer(buf, dtype, int(np.prod(shape)), offset).reshape(shape)
+
+
+class FrameRing(object):
+    """
+    This class is a ring of preallocated frame slots in shared memory, to
+    hand frames from a capture process to analysis processes without
+    pickling them. Frame n goes to slot n % slots, so a reader that falls
+    more than `slots` frames behind loses the oldest ones.
+
+    There is one writer. Readers get NumPy views of the slots (no copy):
+    a slot can be rewritten while a reader still uses its view, so a
+    reader checks valid(seq) once it's done with a frame and discards the
+    result if the frame was overwritten in the meantime. The views must be
+    dropped before close(), which raises BufferError while one is alive
+    (GazeTracking keeps the last frame it refreshed until release_frame()).
+
+        ring = FrameRing((480, 640), slots=8)      # gray frames
+        # capture process
+        seq, slot = ring.claim()
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=slot)
+        ring.publish(seq, t)
+        # analysis process (the ring pickles by name)
+        for seq, t, frame in ring.frames(timeout=1.0):
+            gaze_frame = gaze.refresh(frame)
+            if ring.valid(seq):
+                metrics.feed(t, ...)
+        del frame
+        gaze.release_frame()
+        ring.close()
+    """
+
+    def __init__(self, shape, slots=4, dtype=np.uint8, name=None):
+        """Creates the ring
+
+        Arguments:
+            shape (tuple): (height, width) for gray frames or (height, width, 3) for BGR
+            slots (int): Number of frames the ring holds
+            dtype: Pixel type
+            name (str): Name of the shared memory block (default: generated)
+        """
+        shape = tuple(int(n) for n in shape)
+        if len(shape) not in (2, 3):
+            raise ValueError(f"frames must be (height, width) or (height, width, channels), not {shape}")
+        if slots < 2:
+            raise ValueError("a ring needs at least 2 slots")
+        dtype = np.dtype(dtype)
+
+        size = (_aligned(HEADER_DTYPE.itemsize) + _aligned(SLOT_DTYPE.itemsize * slots)
+                + _aligned(int(np.prod(shape)) * dtype.itemsize) * slots)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._owner = True
+
+        header = _view(self._shm.buf, HEADER_DTYPE, ())
+        header["magic"] = MAGIC
+        header["slots"] = slots
+        header["ndim"] = len(shape)
+        header["shape"] = shape + (0,) * (3 - len(shape))
+        header["dtype"] = dtype.str.encode()
+        header["head"] = -1
+        self._map()
+        self._meta["seq"] = -1
+        self._meta["t"] = 0.0
+
+    @classmethod
+    def attach(cls, name):
+        """Opens the ring created by another process
+
+        Argument:
+            name (str): Name of the shared memory block (FrameRing.name)
+        """
+        ring = cls.__new__(cls)
+        if sys.version_info >= (3, 13):
+            ring._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # same as track=False: only the creator unlinks the block, not the
+            # resource tracker when a process that attached exits. Other blocks
+            # registered meanwhile (other threads) still are.
+            from multiprocessing import resource_tracker
+            with _attach_lock:
+                register = resource_tracker.register
+
+                def register_others(resource, rtype):
+                    if rtype != "shared_memory" or resource.lstrip("/") != name.lstrip("/"):
+                        register(resource, rtype)
+                resource_tracker.register = register_others
+                try:
+                    ring._shm = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        ring._owner = False
+        if bytes(ring._shm.buf[:4]) != MAGIC:
+            ring._shm.close()
+            raise ValueError(f"{name} is not a frame ring")
+        ring._map()
+        return ring
+
+    def _map(self):
+        header = _view(self._shm.buf, HEADER_DTYPE, ())
+        self.slots = int(header["slots"])
+        self.shape = tuple(int(n) for n in header["shape"][:int(header["ndim"])])
+        self.dtype = np.dtype(header["dtype"].item().decode())
+        del header
+        self._views()
+        self._next = int(self._header["head"]) + 1
+        self.dropped = 0
+
+    def _views(self):
+        # the ring's own views of the header, the slot metadata and the slots
+        buf = self._shm.buf
+        self._header = _view(buf, HEADER_DTYPE, ())
+        offset = _aligned(HEADER_DTYPE.itemsize)
+        self._meta = _view(buf, SLOT_DTYPE, (self.slots,), offset)
+        offset += _aligned(SLOT_DTYPE.itemsize * self.slots)
+        frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._frames = [_view(buf, self.dtype, self.shape, offset + i * _aligned(frame_size))
+                        for i in range(self.slots)]
+
+    def __getstate__(self):
+        return self.name
+
+    def __setstate__(self, name):
+        self.__dict__.update(FrameRing.attach(name).__dict__)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def head(self):
+        """Sequence number of the last published frame, -1 if none"""
+        return int(self._header["head"])
+
+    # writer
+
+    def claim(self):
+        """Returns (seq, view) of the slot the next frame is written to,
+        e.g. with capture.read(view) or cv2.cvtColor(..., dst=view)"""
+        seq = self.head + 1
+        index = seq % self.slots
+        # readers of the frame this slot held see it's gone before the pixels change
+        self._meta[index]["seq"] = -1
+        return seq, self._frames[index]
+
+    def publish(self, seq, t=None):
+        """Makes the frame written in a claimed slot visible to readers
+
+        Arguments:
+            seq (int): Sequence number returned by claim()
+            t (float): Capture time (default: now)
+        """
+        index = seq % self.slots
+        self._meta[index]["t"] = time.time() if t is None else t
+        self._meta[index]["seq"] = seq
+        self._header["head"] = seq
+
+    def write(self, frame, t=None):
+        """Copies a frame in the next slot and publishes it, returns its sequence number"""
+        seq, slot = self.claim()
+        slot[...] = frame
+        self.publish(seq, t)
+        return seq
+
+    # readers
+
+    def get(self, seq):
+        """Returns (t, view) of a frame, or None if it isn't published yet or was overwritten"""
+        meta = self._meta[seq % self.slots]
+        if meta["seq"] != seq:
+            return None
+        t = float(meta["t"])
+        # the slot may have been claimed again while t was read
+        if meta["seq"] != seq:
+            return None
+        return t, self._frames[seq % self.slots]
+
+    def valid(self, seq):
+        """Tells if the slot still holds frame seq (its view wasn't overwritten)"""
+        return self._meta[seq % self.slots]["seq"] == seq
+
+    def latest(self):
+        """Returns (seq, t, view) of the last published frame, or None"""
+        seq = self.head
+        if seq < 0:
+            return None
+        item = self.get(seq)
+        return None if item is None else (seq,) + item
+
+    def frames(self, timeout=None, poll=0.001):
+        """Yields (seq, t, view) of the frames in order, waiting for new ones.
+        Frames overwritten before being read are skipped and counted in
+        self.dropped. Stops after timeout seconds without a new frame.
+
+        Arguments:
+            timeout (float): Seconds to wait for a frame (None: forever)
+            poll (float): Seconds between checks of the head
+        """
+        waited = 0.0
+        while True:
+            head = self.head
+            if head < self._next:
+                if timeout is not None and waited >= timeout:
+                    return
+                time.sleep(poll)
+                waited += poll
+                continue
+            waited = 0.0
+            oldest = head - self.slots + 1
+            if self._next < oldest:
+                self.dropped += oldest - self._next
+                self._next = oldest
+            seq = self._next
+            self._next += 1
+            item = self.get(seq)
+            if item is None:
+                self.dropped += 1
+                continue
+            # no local of the suspended generator keeps the view, so close() works once the caller drops it
+            t, item = item[0], None
+            yield seq, t, self._frames[seq % self.slots]
+
+    def close(self):
+        """Releases the ring's views and closes the block; the creator also
+        removes it. The views returned by get(), latest() and frames() must be
+        dropped first: while one is alive, the block can't be unmapped,
+        BufferError is raised and the ring stays usable (close() can be
+        called again once the views are dropped)."""
+        if self._header is None:
+            return
+        self._header = self._meta = None
+        self._frames = []
+        try:
+            self._shm.close()
+        except BufferError:
+            # SharedMemory.close() released its memoryview before failing on the still mapped block
+            if self._shm._buf is None:
+                self._shm._buf = memoryview(self._shm._mmap)
+            self._views()
+            raise BufferError(f"frame ring {self.name} is still viewed: drop the frames returned by get(), "
+                              f"latest() and frames() (and GazeTracking.release_frame()) before close()") from None
+        if self._owner:
+            self._owner = False
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
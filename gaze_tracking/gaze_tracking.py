@@ -1,9 +1,90 @@
 from __future__ import division
-import os
+from collections import namedtuple
 import cv2
 import dlib
+from . import models
 from .eye import Eye
 from .calibration import Calibration
+from .pupil import Pupil
+
+
+class GazeFrame(namedtuple("GazeFrame", ["pupils_located", "pupil_left", "pupil_right",
+                                         "horizontal_ratio", "vertical_ratio", "blinking"])):
+    """
+    This class holds the gaze state of one frame, computed once by
+    GazeTracking.refresh(). Every value is None when the pupils
+    haven't been located.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_eyes(cls, eye_left, eye_right):
+        """Computes the gaze state from the two Eye objects of a frame
+
+        Arguments:
+            eye_left (eye.Eye): Left eye, or None if no face was found
+            eye_right (eye.Eye): Right eye, or None if no face was found
+        """
+        try:
+            eyes = (eye_left, eye_right)
+            pupils = [(eye.pupil.x, eye.pupil.y) for eye in eyes]
+        except Exception:
+            return NO_GAZE
+        return cls.from_measures([eye.origin for eye in eyes], [eye.center for eye in eyes],
+                                 pupils, [eye.blinking for eye in eyes])
+
+    @classmethod
+    def from_measures(cls, origins, centers, pupils, blinks):
+        """Computes the gaze state from the measures of the two eyes, as
+        stored by frame_cache
+
+        Arguments:
+            origins (list): (x, y) of the left and right eye frames in the frame
+            centers (list): (x, y) centers of the left and right eye frames
+            pupils (list): (x, y) of the left and right pupils in their eye frame
+            blinks (list): Blinking ratios of the left and right eyes (None when closed)
+        """
+        (origin_left, origin_right), (center_left, center_right) = origins, centers
+        try:
+            (x_left, y_left), (x_right, y_right) = pupils
+            pupil_left = (origin_left[0] + int(x_left), origin_left[1] + int(y_left))
+            pupil_right = (origin_right[0] + int(x_right), origin_right[1] + int(y_right))
+        except Exception:
+            return NO_GAZE
+
+        horizontal = (x_left / (center_left[0] * 2 - 10) + x_right / (center_right[0] * 2 - 10)) / 2
+        vertical = (y_left / (center_left[1] * 2 - 10) + y_right / (center_right[1] * 2 - 10)) / 2
+
+        # a ratio is None when the eye has no height at all, ie it's closed
+        if blinks[0] is None or blinks[1] is None:
+            blinking = True
+        else:
+            blinking = (blinks[0] + blinks[1]) / 2 > 3.8
+
+        return cls(True, pupil_left, pupil_right, horizontal, vertical, blinking)
+
+    @property
+    def is_right(self):
+        """True if the user is looking to the right"""
+        if self.pupils_located:
+            return self.horizontal_ratio <= 0.35
+
+    @property
+    def is_left(self):
+        """True if the user is looking to the left"""
+        if self.pupils_located:
+            return self.horizontal_ratio >= 0.65
+
+    @property
+    def is_center(self):
+        """True if the user is looking to the center"""
+        if self.pupils_located:
+            return not self.is_right and not self.is_left
+
+
+# gaze state of a frame where the pupils weren't located
+NO_GAZE = GazeFrame(False, None, None, None, None, None)
 
 
 class GazeTracking(object):
@@ -13,43 +94,247 @@ class GazeTracking(object):
     and pupils and allows to know if the eyes are open or closed
     """
 
-    def __init__(self):
+    # size (px) of the smallest face the HOG detector finds
+    DETECTOR_WINDOW = 80
+
+    def __init__(self, track_face=False, redetect_interval=30, track_margin=0.2, instrumentation=None,
+                 detection_scale=1.0, min_face_size=None, model_path=models.DEFAULT_MODEL_PATH,
+                 pupil_mode=Pupil.ACCURATE, scheduler=None, calibration=None):
+        """
+        Arguments:
+            track_face (bool): Seed the face box from the previous frame's landmarks
+                instead of running the face detector on every frame
+            redetect_interval (int): Maximum number of tracked frames between two
+                full-frame detections
+            track_margin (float): Largest change of the landmarks between two tracked
+                frames (scale, or move of their center as a fraction of the face width)
+                before the face detector runs again
+            instrumentation (Instrumentation): Collects stage timings and counters (off if None)
+            detection_scale (float or list): Scale of the frame the face detector runs on,
+                or pyramid of scales tried in order until a face is found. Landmarks and
+                eyes always use the full resolution frame.
+            min_face_size (int): Smallest face expected (px, full resolution). Scales at which
+                such a face would be too small to be detected are pruned.
+            model_path (str): Landmark model, loaded on the first refresh and shared
+                with every other GazeTracking of the process
+            pupil_mode (str): Pupil.ACCURATE or Pupil.FAST (cheaper filtering and centroid)
+            scheduler (AdaptiveScheduler): Skips the analysis of frames where the eyes
+                didn't move and reuses the last result (off if None)
+            calibration (Calibration): Starting calibration, e.g. the profile of a returning
+                subject (Calibration.from_profile). Its pupil mode must be pupil_mode.
+        """
         self.frame = None
+        self.landmarks = None
         self.eye_left = None
         self.eye_right = None
-        self.calibration = Calibration()
+        self.gaze_frame = NO_GAZE
+        if calibration is None:
+            calibration = Calibration(pupil_mode)
+        elif calibration.pupil_mode != pupil_mode:
+            raise ValueError(f"calibration was made for the {calibration.pupil_mode!r} pupil mode, not {pupil_mode!r}")
+        self.calibration = calibration
+        self.instrumentation = instrumentation
+        self.scheduler = scheduler
+
+        self.track_face = track_face
+        self.redetect_interval = redetect_interval
+        self.track_margin = track_margin
+        self._face_box = None
+        self._extent = None
+        self._box_fit = None
+        self._tracked_since_detection = 0
+        self._scales = self._detection_scales(detection_scale, min_face_size)
 
-        # _face_detector is used to detect faces
-        self._face_detector = dlib.get_frontal_face_detector()
+        # counters describing how the face box was obtained
+        self.detector_runs = 0
+        self.tracked_frames = 0
+        self.tracking_failures = 0
 
-        # _predictor is used to get facial landmarks of a given face
-        cwd = os.path.abspath(os.path.dirname(__file__))
-        model_path = os.path.abspath(os.path.join(cwd, "trained_models/shape_predictor_68_face_landmarks.dat"))
-        self._predictor = dlib.shape_predictor(model_path)
+        # _predictor is used to get facial landmarks of a given face, it comes from the
+        # shared registry of models.py on the first refresh. Faces are detected with the
+        # detector of the thread running refresh(), also from models.py
+        self.model_path = model_path
+        self._predictor = None
 
     @property
     def pupils_located(self):
         """Check that the pupils have been located"""
-        try:
-            int(self.eye_left.pupil.x)
-            int(self.eye_left.pupil.y)
-            int(self.eye_right.pupil.x)
-            int(self.eye_right.pupil.y)
-            return True
-        except Exception:
-            return False
+        return self.gaze_frame.pupils_located
+
+    def load_models(self):
+        """Gets the landmark predictor from the shared registry, loading it if
+        no other GazeTracking did, and builds the thread's face detector"""
+        models.face_detector()
+        self._predictor = models.shape_predictor(self.model_path)
+        models.register_user()
+
+    @classmethod
+    def _detection_scales(cls, detection_scale, min_face_size):
+        """Returns the scales the face detector runs on, in order
+
+        Arguments:
+            detection_scale (float or list): Scale or pyramid of scales
+            min_face_size (int): Smallest face expected (px), or None
+        """
+        if isinstance(detection_scale, (list, tuple)):
+            scales = list(detection_scale)
+        else:
+            scales = [detection_scale]
+        if any(not 0 < scale <= 1 for scale in scales):
+            raise ValueError(f"detection scales must be in (0, 1], not {scales}")
+
+        if min_face_size:
+            kept = [scale for scale in scales if min_face_size * scale >= cls.DETECTOR_WINDOW]
+            scales = kept or [max(scales)]
+        return scales
+
+    def _detect_face(self, frame):
+        """Runs the face detector on the full frame, downscaled by each detection
+        scale in turn, and returns the first face found mapped to full resolution
+
+        Arguments:
+            frame (numpy.ndarray): Grayscale frame
+        """
+        self.detector_runs += 1
+        self._tracked_since_detection = 0
+        # looked up on each detection: the tracker may be refreshed from another thread
+        detector = models.face_detector()
+
+        for scale in self._scales:
+            if scale == 1:
+                faces = detector(frame)
+                if faces:
+                    return faces[0]
+                continue
+
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            faces = detector(small)
+            if faces:
+                face = faces[0]
+                return dlib.rectangle(int(round(face.left() / scale)), int(round(face.top() / scale)),
+                                      int(round(face.right() / scale)), int(round(face.bottom() / scale)))
+
+        raise IndexError("no face found")
+
+    @staticmethod
+    def _landmarks_extent(landmarks):
+        """Returns the (left, top, right, bottom) extent of the landmarks"""
+        xs = [landmarks.part(i).x for i in range(landmarks.num_parts)]
+        ys = [landmarks.part(i).y for i in range(landmarks.num_parts)]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _fit_box(self, box, extent):
+        """Learns where the face detector puts its box around the landmarks,
+        so the boxes built on tracked frames have the same geometry as the
+        ones the landmark model was trained on
+
+        Arguments:
+            box (dlib.rectangle): Box found by the face detector
+            extent (tuple): Extent of the landmarks predicted in that box
+        """
+        left, top, right, bottom = extent
+        width, height = max(right - left, 1), max(bottom - top, 1)
+        self._box_fit = ((box.left() - left) / width, (box.top() - top) / height,
+                         box.width() / width, box.height() / height)
+
+    def _landmarks_box(self, extent, frame, previous=None):
+        """Returns the face box to use on the next frame, built from the
+        landmarks of the current one, or None if the landmarks can't be trusted.
+
+        Arguments:
+            extent (tuple): Extent of the landmarks of the current frame
+            frame (numpy.ndarray): Grayscale frame
+            previous (tuple): Extent of the landmarks of the previous frame, to
+                check the new ones against (None on a detection frame)
+        """
+        left, top, right, bottom = extent
+        width, height = right - left, bottom - top
+        frame_height, frame_width = frame.shape[:2]
+
+        # the face drifted out of the frame
+        if left < 0 or top < 0 or right >= frame_width or bottom >= frame_height:
+            return None
+
+        # the predictor collapsed or blew up the shape, or it jumped away from the face
+        if previous is not None:
+            previous_width = max(previous[2] - previous[0], 1)
+            scale = width / previous_width
+            moved = max(abs(left + right - previous[0] - previous[2]),
+                        abs(top + bottom - previous[1] - previous[3])) / 2 / previous_width
+            if not 1 / (1 + self.track_margin) <= scale <= 1 + self.track_margin or moved > self.track_margin:
+                return None
+
+        offset_x, offset_y, scale_x, scale_y = self._box_fit
+        box_left = int(round(left + offset_x * width))
+        box_top = int(round(top + offset_y * height))
+        return dlib.rectangle(max(box_left, 0), max(box_top, 0),
+                              min(box_left + int(round(scale_x * width)) - 1, frame_width - 1),
+                              min(box_top + int(round(scale_y * height)) - 1, frame_height - 1))
 
     def _analyze(self):
         """Detects the face and initialize Eye objects"""
-        frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
-        faces = self._face_detector(frame)
+        inst = self.instrumentation
+        if inst is not None:
+            start = inst.clock()
+        if self.frame.ndim == 2:
+            # the producer already converted the frame (e.g. a gray FrameRing)
+            frame = self.frame
+        else:
+            frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        if inst is not None:
+            inst.record("grayscale", start)
 
         try:
-            landmarks = self._predictor(frame, faces[0])
+            tracked = (self.track_face and self._face_box is not None
+                       and self._tracked_since_detection < self.redetect_interval)
+            if tracked:
+                self._tracked_since_detection += 1
+                if inst is not None:
+                    start = inst.clock()
+                landmarks = self._predictor(frame, self._face_box)
+                if inst is not None:
+                    inst.record("landmarks", start)
+                extent = self._landmarks_extent(landmarks)
+                self._face_box = self._landmarks_box(extent, frame, self._extent)
+                self._extent = extent
+                if self._face_box is None:
+                    self.tracking_failures += 1
+                    tracked = False
+                else:
+                    self.tracked_frames += 1
+
+            if not tracked:
+                if inst is not None:
+                    start = inst.clock()
+                face = self._detect_face(frame)
+                if inst is not None:
+                    inst.record("detection", start)
+                    start = inst.clock()
+                landmarks = self._predictor(frame, face)
+                if inst is not None:
+                    inst.record("landmarks", start)
+                if self.track_face:
+                    self._extent = self._landmarks_extent(landmarks)
+                    self._fit_box(face, self._extent)
+                    self._face_box = self._landmarks_box(self._extent, frame)
+
+            if inst is not None:
+                if not self.calibration.is_complete():
+                    inst.count("calibration_frames")
+                start = inst.clock()
+            self.landmarks = landmarks
             self.eye_left = Eye(frame, landmarks, 0, self.calibration)
             self.eye_right = Eye(frame, landmarks, 1, self.calibration)
+            if inst is not None:
+                inst.record("eyes", start)
 
         except IndexError:
+            if inst is not None:
+                inst.record("detection", start)
+                inst.count("detection_failures")
+            self._face_box = None
+            self._extent = None
+            self.landmarks = None
             self.eye_left = None
             self.eye_right = None
 
@@ -57,74 +342,104 @@ class GazeTracking(object):
         """Refreshes the frame and analyzes it.
 
         Arguments:
-            frame (numpy.ndarray): The frame to analyze
+            frame (numpy.ndarray): The frame to analyze, BGR or already gray
+
+        Returns:
+            The GazeFrame computed for this frame
         """
+        if self._predictor is None:
+            self.load_models()
         self.frame = frame
+        inst = self.instrumentation
+
+        scheduler = self.scheduler
+        if scheduler is not None:
+            if scheduler.can_reuse(frame, self.gaze_frame):
+                if inst is not None:
+                    inst.count("frames")
+                    inst.count("frames_reused")
+                    inst.tick()
+                return self.gaze_frame
+
         self._analyze()
+        self.gaze_frame = GazeFrame.from_eyes(self.eye_left, self.eye_right)
+        if scheduler is not None:
+            scheduler.analyzed_frame(frame, (self.eye_left, self.eye_right), self.gaze_frame)
+
+        if inst is not None:
+            inst.count("frames")
+            if not self.gaze_frame.pupils_located:
+                inst.count("pupils_not_located")
+            inst.tick()
+        return self.gaze_frame
+
+    def release_frame(self):
+        """Drops the reference to the last refreshed frame, e.g. a FrameRing
+        view that must be released before the ring is closed. annotated_frame()
+        needs a frame again after this."""
+        self.frame = None
+
+    def stats(self):
+        """Returns the instrumentation timings and counters (empty if instrumentation
+        is off) along with the face tracking counters, the shared models stats
+        and the scheduler stats"""
+        stats = self.instrumentation.stats() if self.instrumentation is not None else {}
+        stats["face_box"] = dict(detector_runs=self.detector_runs, tracked_frames=self.tracked_frames,
+                                 tracking_failures=self.tracking_failures)
+        stats["models"] = models.stats()
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.stats()
+        return stats
 
     def pupil_left_coords(self):
         """Returns the coordinates of the left pupil"""
-        if self.pupils_located:
-            x = self.eye_left.origin[0] + self.eye_left.pupil.x
-            y = self.eye_left.origin[1] + self.eye_left.pupil.y
-            return (x, y)
+        return self.gaze_frame.pupil_left
 
     def pupil_right_coords(self):
         """Returns the coordinates of the right pupil"""
-        if self.pupils_located:
-            x = self.eye_right.origin[0] + self.eye_right.pupil.x
-            y = self.eye_right.origin[1] + self.eye_right.pupil.y
-            return (x, y)
+        return self.gaze_frame.pupil_right
 
     def horizontal_ratio(self):
         """Returns a number between 0.0 and 1.0 that indicates the
         horizontal direction of the gaze. The extreme right is 0.0,
         the center is 0.5 and the extreme left is 1.0
         """
-        if self.pupils_located:
-            pupil_left = self.eye_left.pupil.x / (self.eye_left.center[0] * 2 - 10)
-            pupil_right = self.eye_right.pupil.x / (self.eye_right.center[0] * 2 - 10)
-            return (pupil_left + pupil_right) / 2
+        return self.gaze_frame.horizontal_ratio
 
     def vertical_ratio(self):
         """Returns a number between 0.0 and 1.0 that indicates the
         vertical direction of the gaze. The extreme top is 0.0,
         the center is 0.5 and the extreme bottom is 1.0
         """
-        if self.pupils_located:
-            pupil_left = self.eye_left.pupil.y / (self.eye_left.center[1] * 2 - 10)
-            pupil_right = self.eye_right.pupil.y / (self.eye_right.center[1] * 2 - 10)
-            return (pupil_left + pupil_right) / 2
+        return self.gaze_frame.vertical_ratio
 
     def is_right(self):
         """Returns true if the user is looking to the right"""
-        if self.pupils_located:
-            return self.horizontal_ratio() <= 0.35
+        return self.gaze_frame.is_right
 
     def is_left(self):
         """Returns true if the user is looking to the left"""
-        if self.pupils_located:
-            return self.horizontal_ratio() >= 0.65
+        return self.gaze_frame.is_left
 
     def is_center(self):
         """Returns true if the user is looking to the center"""
-        if self.pupils_located:
-            return self.is_right() is not True and self.is_left() is not True
+        return self.gaze_frame.is_center
 
     def is_blinking(self):
         """Returns true if the user closes his eyes"""
-        if self.pupils_located:
-            blinking_ratio = (self.eye_left.blinking + self.eye_right.blinking) / 2
-            return blinking_ratio > 3.8
+        return self.gaze_frame.blinking
 
     def annotated_frame(self):
         """Returns the main frame with pupils highlighted"""
-        frame = self.frame.copy()
+        if self.frame.ndim == 2:
+            frame = cv2.cvtColor(self.frame, cv2.COLOR_GRAY2BGR)
+        else:
+            frame = self.frame.copy()
 
-        if self.pupils_located:
+        if self.gaze_frame.pupils_located:
             color = (0, 255, 0)
-            x_left, y_left = self.pupil_left_coords()
-            x_right, y_right = self.pupil_right_coords()
+            x_left, y_left = self.gaze_frame.pupil_left
+            x_right, y_right = self.gaze_frame.pupil_right
             cv2.line(frame, (x_left - 5, y_left), (x_left + 5, y_left), color)
             cv2.line(frame, (x_left, y_left - 5), (x_left, y_left + 5), color)
             cv2.line(frame, (x_right - 5, y_right), (x_right + 5, y_right), color)
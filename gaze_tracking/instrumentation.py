@@ -0,0 +1,119 @@
+from __future__ import division
+import bisect
+import threading
+import time
+
+
+class LatencyHistogram(object):
+    """
+    This class records durations in a fixed number of log-spaced buckets,
+    so its memory doesn't grow with the number of samples. Percentiles
+    are approximated by the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, lowest=1e-6, highest=10.0, factor=1.25):
+        self.bounds = []
+        bound = lowest
+        while bound < highest:
+            self.bounds.append(bound)
+            bound *= factor
+        self.bounds.append(highest)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Records a duration in seconds"""
+        self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Returns the approximate q-th percentile (0-100) in seconds"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, nb in enumerate(self.buckets):
+            seen += nb
+            if seen >= rank and nb:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        """Returns count, mean, p50/p95/p99 and max in milliseconds"""
+        if not self.count:
+            return dict(count=0)
+        return dict(
+            count=self.count,
+            mean_ms=self.total / self.count * 1000,
+            p50_ms=self.percentile(50) * 1000,
+            p95_ms=self.percentile(95) * 1000,
+            p99_ms=self.percentile(99) * 1000,
+            max_ms=self.max * 1000,
+        )
+
+
+class Instrumentation(object):
+    """
+    This class collects per-stage timings and counters of the hot path.
+    A GazeTracking and the PSPGazeMetrics using it can share one instance.
+    Instrumentation is off unless an instance is passed to them: the hot
+    path then only checks that its instrumentation attribute is None.
+    """
+
+    def __init__(self, reporter=None, report_interval=10.0):
+        """
+        Arguments:
+            reporter: Function called with stats() every report_interval seconds
+            report_interval (float): Seconds between two reports
+        """
+        self.timings = {}
+        self.counters = {}
+        self.reporter = reporter
+        self.report_interval = report_interval
+        self._last_report = time.monotonic()
+        self._lock = threading.Lock()
+
+    # time source for the stages, callers do: start = inst.clock() ... inst.record(stage, start)
+    clock = staticmethod(time.perf_counter)
+
+    def record(self, stage, start):
+        """Records the time elapsed since start (a clock() value) for a stage"""
+        elapsed = time.perf_counter() - start
+        histogram = self.timings.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.timings.setdefault(stage, LatencyHistogram())
+        histogram.add(elapsed)
+
+    def count(self, name, nb=1):
+        """Increments a counter"""
+        self.counters[name] = self.counters.get(name, 0) + nb
+
+    def tick(self):
+        """Calls the reporter if report_interval has elapsed since the last report"""
+        if self.reporter is None:
+            return
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.reporter(self.stats())
+
+    def stats(self):
+        """Returns the timing summaries per stage and the counters"""
+        with self._lock:
+            timings = dict(self.timings)
+        return dict(
+            timings={stage: histogram.summary() for stage, histogram in timings.items()},
+            counters=dict(self.counters),
+        )
+
+    def reset(self):
+        """Clears every timing and counter"""
+        with self._lock:
+            self.timings = {}
+            self.counters = {}
@@ -1,6 +1,25 @@
+import atexit
 import csv
+import itertools
+import queue
+import struct
+import threading
 import time
+import weakref
+from collections import namedtuple
 from pathlib import Path
+import numpy as np
+
+def call_at_exit(method):
+    # calls a bound method at interpreter exit if its object is still alive, without keeping it alive
+    ref = weakref.WeakMethod(method)
+
+    def call():
+        bound = ref()
+        if bound is not None:
+            bound()
+    atexit.register(call)
+
 
 class EventLogger:
     # logs data into csv 
@@ -9,24 +28,257 @@ class EventLogger:
         self.start = time.time()
         self.path = Path(write_file)
         
+    HEADER = ["timestamp", "type", "field1", "field2", "field3"]
+
     # functions called by PSPGazeMetrics
     def log_frame(self, t, h, v, blink):
-        self.rows.append((t, "FRAME",
-                          f"h={h:.3f}" if h is not None else "h=None",
-                          f"v={v:.3f}" if v is not None else "v=None",
-                          f"blink={blink}"))
+        self._append((t, "FRAME",
+                      f"h={h:.3f}" if h is not None else "h=None",
+                      f"v={v:.3f}" if v is not None else "v=None",
+                      f"blink={blink}"))
 
     def log_event(self, t0, t1, amp, vel, axis, kind):
-        self.rows.append((t1, f"{axis}-{kind}",
-                          f"amp={amp:.3f}",
-                          f"vel={vel:.3f}",
-                          f"dt={t1-t0:.3f}"))
+        self._append((t1, f"{axis}-{kind}",
+                      f"amp={amp:.3f}",
+                      f"vel={vel:.3f}",
+                      f"dt={t1-t0:.3f}"))
+
+    def _append(self, row):
+        self.rows.append(row)
         
     # exporting
     def to_csv(self):
-        header = ["timestamp", "type", "field1", "field2", "field3"]
         with self.path.open("w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(header)
+            writer.writerow(self.HEADER)
             writer.writerows(self.rows)
-        print(f"[LOGGER] wrote {len(self.rows)} rows → {self.path.absolute()}")
\ No newline at end of file
+        print(f"[LOGGER] wrote {len(self.rows)} rows → {self.path.absolute()}")
+
+    def save(self):
+        self.to_csv()
+
+
+class StreamingEventLogger(EventLogger):
+    # same csv as EventLogger, but rows go through a fixed-size buffer that a background
+    # thread writes to disk in batches, so memory stays flat. Rows reach the disk within
+    # flush_interval: a crash loses the rows not written yet (up to buffer_size + batch_size),
+    # at interpreter exit the buffer is written by close().
+    # when the buffer is full, block=True makes log_* wait for the writer (backpressure),
+    # block=False drops the row and counts it in self.dropped. If the writer thread stopped on
+    # an error, log_* raise RuntimeError instead of waiting forever.
+    _END = None # pushed by close() to stop the writer
+
+    def __init__(self, write_file="gaze_log.csv", buffer_size=4096, batch_size=256,
+                 flush_interval=1.0, block=True):
+        super().__init__(write_file)
+        self.rows = None # nothing is kept in memory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._closed = False
+        self._dropped_lock = threading.Lock() # dropped is counted by both threads
+        self._file = self.path.open("w", newline="")
+        csv.writer(self._file).writerow(self.HEADER)
+        self._writer = threading.Thread(target=self._drain, name="event-logger", daemon=True)
+        self._writer.start()
+        call_at_exit(self.close)
+
+    def _drop(self, n):
+        with self._dropped_lock:
+            self.dropped += n
+
+    def _put(self, item):
+        # waits for room in the buffer while the writer is running: a stopped writer never makes room
+        while True:
+            if not self._writer.is_alive():
+                raise RuntimeError(f"the writer of {self.path} stopped") from self.error
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _append(self, row):
+        if self._closed:
+            raise ValueError(f"logger for {self.path} is closed")
+        if self.block:
+            self._put(row)
+            return
+        if not self._writer.is_alive():
+            raise RuntimeError(f"the writer of {self.path} stopped") from self.error
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._drop(1)
+
+    def _drain(self):
+        # writer thread: flushes a batch when it's full or every flush_interval seconds
+        writer = csv.writer(self._file)
+        batch = []
+        last_flush = time.monotonic()
+        done = False
+        try:
+            while not done:
+                timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0)
+                try:
+                    row = self._queue.get(timeout=timeout)
+                    if row is self._END:
+                        done = True
+                    else:
+                        batch.append(row)
+                except queue.Empty:
+                    pass
+
+                if batch and (done or len(batch) >= self.batch_size
+                              or time.monotonic() - last_flush >= self.flush_interval):
+                    try:
+                        writer.writerows(batch)
+                        self._file.flush()
+                        self.written += len(batch)
+                    except OSError as e:
+                        self.error = e
+                        self._drop(len(batch))
+                    batch = []
+                if not batch:
+                    last_flush = time.monotonic()
+        except Exception as e:
+            # the thread stops: log_* and close() see it through is_alive()
+            self.error = e
+            self._drop(len(batch) + self._queue.qsize())
+        finally:
+            self._file.close()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        # writes everything still buffered and stops the writer, can be called several times
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._put(self._END)
+        except RuntimeError:
+            pass # the writer already stopped, self.error says why
+        self._writer.join()
+        print(f"[LOGGER] wrote {self.written} rows ({self.dropped} dropped) → {self.path.absolute()}")
+
+    # the file is written as the session goes, exporting only means closing it
+    def to_csv(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# binary session format: header, then the frame records, then the event records
+SESSION_MAGIC = b"PSPG"
+SESSION_VERSION = 1
+SESSION_HEADER = struct.Struct("<4sHHQQd")  # magic, version, reserved, n_frames, n_events, start
+
+FRAME_DTYPE = np.dtype([("t", "<f8"), ("h", "<f4"), ("v", "<f4"), ("blink", "u1")])
+EVENT_DTYPE = np.dtype([("t", "<f8"), ("kind", "u1"), ("axis", "u1"),
+                        ("amp", "<f4"), ("vel", "<f4"), ("dt", "<f4")])
+
+EVENT_KINDS = ("SACCADE", "JITTER")
+EVENT_AXES = ("H", "V")
+BLINK_UNKNOWN = 255  # blink flag stored when the pupils weren't located
+
+Session = namedtuple("Session", ["start", "frames", "events"])
+
+
+class BinaryEventLogger:
+    # same interface as EventLogger, but records are kept typed in preallocated numpy arrays
+    # and saved in a compact binary file that load_session() maps back without copying
+    def __init__(self, write_file="gaze_log.pspg", capacity=1 << 16):
+        self.start = time.time()
+        self.path = Path(write_file)
+        self.frames = np.empty(capacity, FRAME_DTYPE)
+        self.events = np.empty(capacity // 4 or 1, EVENT_DTYPE)
+        self.n_frames = 0
+        self.n_events = 0
+
+    @staticmethod
+    def _grow(records, n):
+        # doubles the capacity of a full record array
+        if n < len(records):
+            return records
+        grown = np.empty(2 * len(records), records.dtype)
+        grown[:n] = records[:n]
+        return grown
+
+    # functions called by PSPGazeMetrics
+    def log_frame(self, t, h, v, blink):
+        self.frames = self._grow(self.frames, self.n_frames)
+        self.frames[self.n_frames] = (t,
+                                      np.nan if h is None else h,
+                                      np.nan if v is None else v,
+                                      BLINK_UNKNOWN if blink is None else blink)
+        self.n_frames += 1
+
+    def log_event(self, t0, t1, amp, vel, axis, kind):
+        self.events = self._grow(self.events, self.n_events)
+        self.events[self.n_events] = (t1, EVENT_KINDS.index(kind), EVENT_AXES.index(axis), amp, vel, t1 - t0)
+        self.n_events += 1
+
+    # exporting
+    def save(self):
+        with self.path.open("wb") as f:
+            f.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, 0, self.n_frames, self.n_events, self.start))
+            self.frames[:self.n_frames].tofile(f)
+            self.events[:self.n_events].tofile(f)
+        print(f"[LOGGER] wrote {self.n_frames} frames, {self.n_events} events → {self.path.absolute()}")
+
+    def to_csv(self, write_file=None):
+        # exports the session in the EventLogger csv format (default: same name, .csv)
+        logger = EventLogger(write_file or self.path.with_suffix(".csv"))
+        logger.start = self.start
+        logger.rows = list(session_rows(Session(self.start, self.frames[:self.n_frames], self.events[:self.n_events])))
+        logger.to_csv()
+
+
+def load_session(path):
+    # maps a binary session file: frames and events are read-only structured arrays backed by the file,
+    # columns are accessed by name (session.frames["v"], session.events["vel"])
+    path = Path(path)
+    with path.open("rb") as f:
+        header = f.read(SESSION_HEADER.size)
+    if len(header) < SESSION_HEADER.size:
+        raise ValueError(f"{path} is not a session file")
+    magic, version, _, n_frames, n_events, start = SESSION_HEADER.unpack(header)
+    if magic != SESSION_MAGIC:
+        raise ValueError(f"{path} is not a session file")
+    if version != SESSION_VERSION:
+        raise ValueError(f"{path} has unsupported session version {version}")
+
+    offset = SESSION_HEADER.size
+    frames = np.memmap(path, FRAME_DTYPE, mode="r", offset=offset, shape=(n_frames,)) if n_frames else \
+        np.empty(0, FRAME_DTYPE)
+    offset += n_frames * FRAME_DTYPE.itemsize
+    events = np.memmap(path, EVENT_DTYPE, mode="r", offset=offset, shape=(n_events,)) if n_events else \
+        np.empty(0, EVENT_DTYPE)
+    return Session(start, frames, events)
+
+
+def session_rows(session):
+    # yields the rows of a session in the EventLogger csv format, sorted by timestamp
+    frames = ((r["t"], 0, r) for r in session.frames)
+    events = ((r["t"], 1, r) for r in session.events)
+    for t, is_event, r in sorted(itertools.chain(frames, events), key=lambda x: (x[0], x[1])):
+        t = float(t)
+        if is_event:
+            yield (t, f"{EVENT_AXES[r['axis']]}-{EVENT_KINDS[r['kind']]}",
+                   f"amp={r['amp']:.3f}", f"vel={r['vel']:.3f}", f"dt={r['dt']:.3f}")
+        else:
+            blink = None if r["blink"] == BLINK_UNKNOWN else bool(r["blink"])
+            yield (t, "FRAME",
+                   f"h={r['h']:.3f}" if not np.isnan(r["h"]) else "h=None",
+                   f"v={r['v']:.3f}" if not np.isnan(r["v"]) else "v=None",
+                   f"blink={blink}")
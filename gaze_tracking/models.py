@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import time
+import dlib
+
+DEFAULT_MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                  "trained_models/shape_predictor_68_face_landmarks.dat"))
+
+# process-wide registry: each landmark model is loaded once, on first use, and shared by every
+# GazeTracking of the process (and by the children of a fork that happens after loading).
+# The HOG face detector isn't safe to run from several threads at once (its scanner keeps
+# state), so each thread builds its own: it's cheap, unlike the landmark models.
+_lock = threading.Lock()
+_local = threading.local()
+_detectors = 0
+_predictors = {}
+_load_seconds = {}
+_users = 0
+
+
+def face_detector():
+    """Returns the HOG face detector of the calling thread, building it on first call"""
+    global _detectors
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        start = time.perf_counter()
+        detector = _local.detector = dlib.get_frontal_face_detector()
+        with _lock:
+            _load_seconds.setdefault("face_detector", time.perf_counter() - start)
+            _detectors += 1
+    return detector
+
+
+def shape_predictor(model_path=DEFAULT_MODEL_PATH):
+    """Returns the shared landmark predictor of a model file, loading it on first call
+
+    Argument:
+        model_path (str): Path of the shape predictor model
+    """
+    predictor = _predictors.get(model_path)
+    if predictor is None:
+        with _lock:
+            predictor = _predictors.get(model_path)
+            if predictor is None:
+                start = time.perf_counter()
+                predictor = dlib.shape_predictor(model_path)
+                _load_seconds[model_path] = time.perf_counter() - start
+                _predictors[model_path] = predictor
+    return predictor
+
+
+def preload(model_path=DEFAULT_MODEL_PATH):
+    """Loads the detector (of the calling thread) and the predictor now. Call
+    it in the parent process before starting a pre-fork worker pool so the
+    children share the models copy-on-write instead of loading their own copy."""
+    face_detector()
+    shape_predictor(model_path)
+
+
+def register_user():
+    """Counts a GazeTracking using the shared models"""
+    global _users
+    with _lock:
+        _users += 1
+
+
+def stats():
+    """Returns the load time of each model, the number of face detectors
+    built (one per thread), the number of trackers that used the models and
+    the peak resident memory of the process"""
+    return dict(
+        load_seconds=dict(_load_seconds),
+        detectors=_detectors,
+        users=_users,
+        peak_rss_mb=_peak_rss_mb(),
+    )
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
@@ -0,0 +1,223 @@
+from __future__ import division
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from . import models
+from .calibration import Calibration
+from .frame_cache import RECORD_DTYPE, frame_record, record_gaze_frame
+from .gaze_tracking import GazeTracking
+from .logger import EventLogger
+from .psp_metrics import PSPGazeMetrics
+
+
+# calibration and GazeTracking options of the current worker process, set by _init_worker
+_worker_calibration = None
+_worker_options = None
+
+
+def _frame_time(capture, index, fps):
+    """Returns the timestamp (in seconds from the start of the video) of the
+    frame that was just read: the container PTS when the backend exposes it,
+    the frame index otherwise.
+
+    Arguments:
+        capture (cv2.VideoCapture): Capture the frame was read from
+        index (int): Index of the frame in the video
+        fps (float): Frame rate of the video
+    """
+    msec = capture.get(cv2.CAP_PROP_POS_MSEC)
+    if msec > 0 or index == 0:
+        return msec / 1000
+    return index / fps
+
+
+def _init_worker(calibration, gaze_options):
+    """Keeps the calibration computed by the parent process and the
+    GazeTracking options for the jobs of a worker process."""
+    global _worker_calibration, _worker_options
+    _worker_calibration = calibration
+    _worker_options = gaze_options
+
+
+def _chunk_gaze():
+    """Returns a GazeTracking in the state left by the parent's calibration.
+    Each chunk starts from it: a worker gets non-contiguous chunks, so face
+    tracking, scheduler and calibration state carried from its previous job
+    would make the results depend on the pool scheduling."""
+    gaze = GazeTracking(**copy.deepcopy(_worker_options))
+    gaze.calibration = copy.deepcopy(_worker_calibration)
+    if gaze.scheduler is not None:
+        gaze.scheduler.reset()
+    return gaze
+
+
+def _open_at(path, start):
+    """Returns a capture of a video whose next read() is frame `start`.
+    Seeking with CAP_PROP_POS_FRAMES lands on a nearby frame with some
+    codecs, so the position is checked on the frame grabbed before `start`
+    and the video is decoded from the beginning when it's wrong.
+
+    Arguments:
+        path (str): Video file
+        start (int): Index of the first frame to read
+    """
+    capture = cv2.VideoCapture(path)
+    if start == 0:
+        return capture
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start - 1)
+    if capture.grab() and int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return capture
+
+    capture.release()
+    capture = cv2.VideoCapture(path)
+    for _ in range(start):
+        if not capture.grab():
+            break
+    return capture
+
+
+def _process_chunk(job):
+    """Decodes and analyzes frames [start, stop) of a video in a worker process.
+
+    Argument:
+        job (tuple): (path, start, stop, fps)
+
+    Returns:
+        The frame_cache records of the decoded frames, in order
+    """
+    path, start, stop, fps = job
+    gaze = _chunk_gaze()
+    capture = _open_at(path, start)
+
+    records = []
+    try:
+        for index in range(start, stop):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            t = _frame_time(capture, index, fps)
+            gaze.refresh(frame)
+            records.append(frame_record(gaze, t))
+    finally:
+        capture.release()
+    return np.array(records, RECORD_DTYPE)
+
+
+def calibrate(path, gaze, max_frames=300):
+    """Runs the calibration on the first frames of a video.
+
+    Arguments:
+        path (str): Video file
+        gaze (GazeTracking): Tracker whose calibration is filled
+        max_frames (int): Number of frames to read at most
+
+    Returns:
+        True if the calibration is complete
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        for _ in range(max_frames):
+            if gaze.calibration.is_complete():
+                break
+            ret, frame = capture.read()
+            if not ret:
+                break
+            gaze.refresh(frame)
+    finally:
+        capture.release()
+    return gaze.calibration.is_complete()
+
+
+def video_info(path):
+    """Returns (frame_count, fps) of a video file. The frame count is
+    obtained by grabbing every frame when the container doesn't store it.
+
+    Argument:
+        path (str): Video file
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"cannot open video {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if count <= 0:
+            count = 0
+            while capture.grab():
+                count += 1
+    finally:
+        capture.release()
+    return count, fps
+
+
+def _analyze_video(path, gaze, workers, chunk_size, gaze_options):
+    """Calibrates gaze on the first frames of a video, then analyzes all its
+    frames in a process pool. Returns the records of the frames, in order."""
+    count, fps = video_info(path)
+    if not calibrate(path, gaze):
+        print(f"[OFFLINE] calibration incomplete for {path}, workers will keep calibrating")
+
+    # loaded before the pool forks, the workers share the parent's models
+    models.preload(gaze.model_path)
+    jobs = [(path, start, min(start + chunk_size, count), fps) for start in range(0, count, chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(gaze.calibration, gaze_options)) as pool:
+        chunks = list(pool.map(_process_chunk, jobs))
+    return np.concatenate(chunks) if chunks else np.zeros(0, RECORD_DTYPE)
+
+
+def process_video(path, logger=None, workers=None, chunk_size=300,
+                  gaze_options=None, metrics_options=None, cache=None):
+    """Runs the GazeTracking + PSPGazeMetrics pipeline on a recorded video.
+
+    The calibration is computed once on the first frames, then chunks of
+    frames are decoded and analyzed in a process pool. The gaze samples are
+    merged back in frame order and fed to PSPGazeMetrics, so saccades and
+    jitters are detected exactly like in a live session, with timestamps
+    taken from the video instead of the wall clock.
+
+    With a cache, the per-frame analysis of a video already processed with
+    the same config is read from disk and only PSPGazeMetrics runs.
+
+    Arguments:
+        path (str): Video file
+        logger (EventLogger): Session log (default: <video name>.csv next to the video)
+        workers (int): Number of worker processes (default: number of CPUs)
+        chunk_size (int): Number of frames analyzed per job
+        gaze_options (dict): Keyword arguments for GazeTracking
+        metrics_options (dict): Keyword arguments for PSPGazeMetrics
+        cache (FrameCache): Cache of the per-frame analysis (off if None)
+
+    Returns:
+        The PSPGazeMetrics that received the session
+    """
+    path = str(path)
+    gaze_options = gaze_options or {}
+    metrics_options = dict(metrics_options or {})
+    if logger is None:
+        logger = EventLogger(os.path.splitext(path)[0] + ".csv")
+
+    gaze = GazeTracking(**gaze_options)
+    metrics_options.setdefault("save_on_exit", False)
+    metrics = PSPGazeMetrics(gaze, logger=logger, **metrics_options)
+
+    records = None
+    if cache is not None:
+        video_hash = cache.video_hash(path)
+        # the chunks matter: tracking and calibration restart from the same state on each chunk
+        config_hash = cache.config_hash(gaze_options, chunk_size=chunk_size,
+                                        calibration=[list(Calibration.THRESHOLDS), Calibration().nb_frames])
+        records = cache.load(video_hash, config_hash)
+    if records is None:
+        records = _analyze_video(path, gaze, workers, chunk_size, gaze_options)
+        if cache is not None:
+            cache.store(video_hash, config_hash, records)
+
+    for record in records:
+        g = record_gaze_frame(record)
+        metrics.feed(float(record["t"]), g.horizontal_ratio, g.vertical_ratio, g.blinking)
+
+    return metrics
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+
+
+class GazePipeline(object):
+    """
+    This class runs capture, analysis and rendering in separate stages
+    connected by bounded queues, so a slow frame doesn't stall the camera.
+
+    Frames are timestamped when they are grabbed, which is the time
+    PSPGazeMetrics uses to compute velocities. When a queue is full, the
+    drop policy decides whether the oldest queued frame or the incoming
+    one is discarded.
+    """
+
+    POLICIES = ("oldest", "newest")
+
+    # the end of the stream is signaled by passing None through the queues
+    _END = None
+
+    def __init__(self, source, metrics, sink=None, queue_size=2, drop_policy="oldest", annotate=True):
+        """
+        Arguments:
+            source: Object with a read() method returning (ret, frame), like cv2.VideoCapture
+            metrics (PSPGazeMetrics): Metrics updated with every analyzed frame
+            sink: Function called with (frame, snapshot) for every analyzed frame,
+                from the thread calling run(). Returning False stops the pipeline.
+            queue_size (int): Capacity of each queue
+            drop_policy (str): "oldest" or "newest", frame dropped when a queue is full
+            annotate (bool): Pass the annotated frame to the sink instead of the raw one
+        """
+        if drop_policy not in self.POLICIES:
+            raise ValueError(f"drop_policy must be one of {self.POLICIES}, not {drop_policy!r}")
+
+        self.source = source
+        self.metrics = metrics
+        self.sink = sink
+        self.drop_policy = drop_policy
+        self.annotate = annotate
+
+        self._captured = queue.Queue(maxsize=queue_size)
+        self._analyzed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.captured_frames = 0
+        self.analyzed_frames = 0
+        self.dropped = {"capture": 0, "analysis": 0}
+
+    def _put(self, q, item, stage):
+        """Puts an item in a queue, applying the drop policy when it's full"""
+        while True:
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                # the end marker is never dropped
+                if self.drop_policy == "newest" and item is not self._END:
+                    self.dropped[stage] += 1
+                    return
+            try:
+                q.get_nowait()
+                self.dropped[stage] += 1
+            except queue.Empty:
+                pass
+
+    def _capture(self):
+        """Capture stage: grabs and timestamps frames"""
+        try:
+            while not self._stop.is_set():
+                ret, frame = self.source.read()
+                t = time.time()
+                if not ret:
+                    break
+                self.captured_frames += 1
+                self._put(self._captured, (t, frame), "capture")
+        finally:
+            self._put(self._captured, self._END, "capture")
+
+    def _analyze(self):
+        """Analysis stage: runs the gaze tracking and the metrics"""
+        try:
+            while True:
+                item = self._captured.get()
+                if item is self._END or self._stop.is_set():
+                    break
+                t, frame = item
+                snapshot = self.metrics.update(frame, t)
+                if self.annotate:
+                    frame = self.metrics.gaze.annotated_frame()
+                self.analyzed_frames += 1
+                self._put(self._analyzed, (frame, snapshot), "analysis")
+        finally:
+            self._put(self._analyzed, self._END, "analysis")
+
+    def start(self):
+        """Starts the capture and analysis threads"""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture, name="gaze-capture", daemon=True),
+            threading.Thread(target=self._analyze, name="gaze-analysis", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the pipeline and waits for its threads"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def results(self):
+        """Yields the (frame, snapshot) pairs of the analysis stage until the
+        source is exhausted or the pipeline is stopped"""
+        while True:
+            item = self._analyzed.get()
+            if item is self._END:
+                return
+            yield item
+
+    def run(self):
+        """Starts the pipeline and feeds the sink from the calling thread
+        (which should be the main thread when the sink uses cv2.imshow)"""
+        self.start()
+        try:
+            for frame, snapshot in self.results():
+                if self.sink is not None and self.sink(frame, snapshot) is False:
+                    break
+        finally:
+            self.stop()
+
+    def queue_depths(self):
+        """Returns the number of items waiting in each queue"""
+        return {"capture": self._captured.qsize(), "analysis": self._analyzed.qsize()}
+
+    def stats(self):
+        """Returns the frame counters and queue depths of the pipeline"""
+        return dict(
+            captured=self.captured_frames,
+            analyzed=self.analyzed_frames,
+            dropped=dict(self.dropped),
+            queue_depths=self.queue_depths(),
+        )
@@ -0,0 +1,163 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .summary import session_series
+
+# decimation methods of plot_vertical_gaze()
+METHODS = ("minmax", "lttb")
+
+
+def minmax_decimate(x, y, buckets):
+    # min/max envelope: the samples are split in `buckets` runs of equal length and only the min and
+    # the max of each run are kept, in time order, so peaks survive decimation. A run without any
+    # ratio gives NaN points, which leave a gap in the line like missing samples do. Returns (x, y)
+    # with at most 2 * buckets points.
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    n = len(y)
+    if n <= 2 * buckets:
+        return x, y
+    size = -(-n // buckets)
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = y
+    runs = padded.reshape(rows, size)
+
+    finite = ~np.isnan(runs)
+    low = np.argmin(np.where(finite, runs, np.inf), axis=1)
+    high = np.argmax(np.where(finite, runs, -np.inf), axis=1)
+    index = np.sort(np.stack([low, high], axis=1), axis=1) + (np.arange(rows) * size)[:, None]
+    index = index.ravel()
+    return x[index], padded[index]
+
+
+def lttb(x, y, points):
+    # Largest-Triangle-Three-Buckets: keeps `points` samples, the first, the last and in each bucket
+    # between them the one forming the largest triangle with the previous kept sample and the mean of
+    # the next bucket. Samples without a ratio are dropped first.
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    known = ~np.isnan(y)
+    x, y = x[known], y[known]
+    n = len(x)
+    if points >= n or points < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    kept = np.empty(points, np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        mean_x = x[next_start:next_stop].mean()
+        mean_y = y[next_start:next_stop].mean()
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return x[kept], y[kept]
+
+
+def bucket_events(t, v, edges):
+    # aggregates markers per bucket of the plot: (t, v, count) of each bucket with events, t and v
+    # being the means of its events
+    t = np.asarray(t, np.float64)
+    v = np.asarray(v, np.float64)
+    buckets = len(edges) - 1
+    ids = np.clip(np.searchsorted(edges, t, side="right") - 1, 0, buckets - 1)
+    counts = np.bincount(ids, minlength=buckets)
+    known = ~np.isnan(v)
+    sum_t = np.bincount(ids, weights=t, minlength=buckets)
+    sum_v = np.bincount(ids[known], weights=v[known], minlength=buckets)
+    count_v = np.bincount(ids[known], minlength=buckets)
+    used = counts > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sum_t[used] / counts[used], sum_v[used] / count_v[used], counts[used]
+
+
+def _dates(t):
+    # epoch seconds -> datetime64 for the time axis
+    return (np.asarray(t, np.float64) * 1e6).astype("datetime64[us]")
+
+
+def plot_vertical_gaze(ax, t, v, saccade_t, saccade_v, width=1000, method="minmax"):
+    # draws the vertical ratio of a session and its saccades on a matplotlib Axes, decimated to about
+    # `width` points (the pixel width of the plot): drawing time doesn't depend on the session length.
+    # Saccades are merged per pixel column, the marker area growing with their number.
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+    if method == "lttb":
+        t_plot, v_plot = lttb(t, v, width)
+    else:
+        t_plot, v_plot = minmax_decimate(t, v, max(width // 2, 1))
+    ax.plot(_dates(t_plot), v_plot, label="Vertical Gaze", color="blue", linewidth=0.8)
+
+    if len(saccade_t) and len(t):
+        edges = np.linspace(t[0], t[-1], width + 1)
+        if edges[-1] > edges[0]:
+            st, sv, counts = bucket_events(saccade_t, saccade_v, edges)
+            ax.scatter(_dates(st), sv, s=16 * np.sqrt(counts), color="red", label="Saccades", zorder=5)
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Vertical Ratio")
+    ax.legend()
+
+
+def render_session(path, output, width=1000, height=400, dpi=100, method="minmax"):
+    """Renders the vertical gaze plot of a session file to an image,
+    without a display (Agg canvas, no pyplot state)
+
+    Arguments:
+        path (str): Session file (see summary.session_series)
+        output (str): Image file
+        width (int): Width of the image (px)
+        height (int): Height of the image (px)
+        dpi (int): Resolution of the image
+        method (str): "minmax" or "lttb"
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    t, v, saccade_t, saccade_v = session_series(path)
+    figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    plot_vertical_gaze(ax, t, v, saccade_t, saccade_v, width=width, method=method)
+    ax.set_title(os.path.basename(path))
+    figure.tight_layout()
+    figure.savefig(output)
+    return output
+
+
+def _render(job):
+    path, output, options = job
+    try:
+        return render_session(path, output, **options)
+    except Exception as e:
+        return e
+
+
+def render_sessions(paths, output_dir, workers=None, **options):
+    """Renders the plots of many sessions in a process pool
+
+    Arguments:
+        paths (list): Session files
+        output_dir (str): Folder of the images, named after the sessions
+        workers (int): Number of worker processes (default: number of CPUs)
+        options: Keyword arguments of render_session()
+
+    Returns:
+        The image path of each session, or the exception that prevented it
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs, names = [], set()
+    for path in paths:
+        # sessions of different folders can share a name
+        stem = name = os.path.splitext(os.path.basename(path))[0]
+        suffix = 1
+        while name in names:
+            name = f"{stem}-{suffix}"
+            suffix += 1
+        names.add(name)
+        jobs.append((str(path), os.path.join(output_dir, name + ".png"), options))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, jobs))
@@ -1,6 +1,69 @@
 import time 
-from collections import deque 
-from .logger import EventLogger 
+from collections import deque, namedtuple
+import numpy as np
+from . import aio
+from .logger import EventLogger, call_at_exit
+
+# events found by detect_events(), one structured array per axis and kind
+EVENT_DTYPE = np.dtype([("t0", "f8"), ("t1", "f8"), ("amp", "f8"), ("vel", "f8")])
+DetectedEvents = namedtuple("DetectedEvents", ["h_saccades", "v_saccades", "h_jitters", "v_jitters"])
+
+
+class MetricsSnapshot(namedtuple("MetricsSnapshot", ["timestamp", "h_ratio", "v_ratio", "last_vert_saccade",
+                                                     "last_horiz_saccade", "last_jitter", "blink"])):
+    # result of PSPGazeMetrics.update(), also readable like the dict it used to be: snapshot["h_ratio"],
+    # get(), keys(), values(), items() and "in" work on the field names. Integer indexes and iteration
+    # still give the values, like a tuple.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return tuple(zip(self._fields, self))
+
+
+class RunningStats:
+    # count, mean and variance (Welford) and peak magnitude of a stream of values, in O(1) memory
+    __slots__ = ("count", "mean", "_m2", "peak")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.peak = 0.0
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.peak = max(self.peak, abs(x))
+
+    @property
+    def variance(self):
+        # sample variance, 0 until two values were added
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def as_dict(self):
+        return dict(count=self.count, mean=self.mean, std=self.variance ** 0.5, peak=self.peak)
+
 
 class PSPGazeMetrics:
     # buffers the gaze, detects saccades and jitters on both axes 
@@ -13,9 +76,12 @@ class PSPGazeMetrics:
          vel_thresh: float = 0.5, 
          jitter_thresh: float = 0.05, 
          blink_skip_frames: int = 3, # ignores 3 frames after a blink
+         event_history: int = 1000, # last events kept per list
+         rate_window: float = 60.0, # seconds over which event rates are computed
          debug: bool = False,
          logger=None, 
-         save_on_exit=True
+         save_on_exit=True,
+         instrumentation=None # stage timings and counters, defaults to the one of gaze
     ):
         self.gaze = gaze
         self.buf = deque(maxlen=history_len)
@@ -26,49 +92,105 @@ class PSPGazeMetrics:
         self.debug = debug
         self.logger = logger or EventLogger()
         self.save_on_exit = save_on_exit
+        self._saved = False
+        if save_on_exit:
+            call_at_exit(self.close)
+        if instrumentation is None:
+            instrumentation = getattr(gaze, "instrumentation", None)
+        self.instrumentation = instrumentation
         
-        # logging
-        self.vert_saccades = []
-        self.horiz_saccades = []
-        self.jitters = []
-        
-    def update (self, frame):
-        # calls during each video frame and returns a dictionary of current ratios and prev detected events 
-        self.gaze.refresh(frame)
+        # logging, only the last event_history events are kept
+        self.vert_saccades = deque(maxlen=event_history)
+        self.horiz_saccades = deque(maxlen=event_history)
+        self.jitters = deque(maxlen=event_history)
+
+        # running statistics of the whole session, per (axis, kind)
+        self.rate_window = rate_window
+        self._first_t = None
+        self._last_t = None
+        self.amp_stats = {}
+        self.vel_stats = {}
+        self._recent = {} # event times within rate_window
+        for key in [(axis, kind) for axis in "HV" for kind in ("SACCADE", "JITTER")]:
+            self.amp_stats[key] = RunningStats()
+            self.vel_stats[key] = RunningStats()
+            self._recent[key] = deque()
         
+    def update (self, frame, t=None):
+        # calls during each video frame and returns a snapshot of current ratios and prev detected events 
+        # t is the capture time of the frame, defaults to now (live camera)
+        inst = self.instrumentation
+        if inst is not None:
+            start = inst.clock()
+        g = self.gaze.refresh(frame)
+        if inst is not None:
+            inst.record("refresh", start)
+        if t is None:
+            t = time.time()
+        return self.feed(t, g.horizontal_ratio, g.vertical_ratio, g.blinking)
+
+    def feed(self, t, h, v, blink):
+        # same as update() for a gaze sample that was already computed (recorded/offline sessions)
+        inst = self.instrumentation
+        if inst is None:
+            return self._feed(t, h, v, blink)
+        start = inst.clock()
+        snapshot = self._feed(t, h, v, blink)
+        inst.record("metrics", start)
+        inst.tick()
+        return snapshot
+
+    def _feed(self, t, h, v, blink):
+        inst = self.instrumentation
         # cooldown after blinks 
-        if self.gaze.is_blinking():
+        if blink:
             self._blink_cooldown = self.blink_skip_frames
-            return self._snapshot(None, None)
+            if inst is not None:
+                inst.count("blink_skipped")
+            return self._snapshot(t, None, None, blink)
         
         if self._blink_cooldown > 0:
             self._blink_cooldown -= 1
-            return self._snapshot(None, None)
-        
-        t = time.time()
-        h = self.gaze.horizontal_ratio()
-        v = self.gaze.vertical_ratio()
+            if inst is not None:
+                inst.count("blink_skipped")
+            return self._snapshot(t, None, None, blink)
         
         if h is None or v is None:
-            return self._snapshot(h, v) # ie, missing data
-        self.logger.log_frame(t, h, v, self.gaze.is_blinking())
+            return self._snapshot(t, h, v, blink) # ie, missing data
+        if inst is not None:
+            start = inst.clock()
+        self.logger.log_frame(t, h, v, blink)
+        if inst is not None:
+            inst.record("logging", start)
         
         if self.buf:
             self._check_axis(t, "H", h)
             self._check_axis(t, "V", v)
         self.buf.append((t, h, v))
-        return self._snapshot(h, v)
+        if self._first_t is None:
+            self._first_t = t
+        self._last_t = t
+        return self._snapshot(t, h, v, blink)
+
+    def stream(self, source, window=4, close_logger=True):
+        # async iterator of update() snapshots for every frame of source: async for snapshot in metrics.stream(cam)
+        # capture and analysis run in executors, see aio.stream()
+        return aio.stream(self, source, window=window, close_logger=close_logger)
+
+    def stats(self):
+        # instrumentation timings and counters (empty if it's off) and the running event statistics
+        stats = self.instrumentation.stats() if self.instrumentation is not None else {}
+        stats["events"] = self.session_stats()
+        return stats
         
     # helper functions
-    def _snapshot(self, h, v):
-        return dict(
-            timestamp=time.time(),
-            h_ratio=h,
-            v_ratio=v,
-            last_vert_saccade=self.vert_saccades[-1] if self.vert_saccades else None,
-            last_horiz_saccade=self.horiz_saccades[-1] if self.horiz_saccades else None,
-            last_jitter=self.jitters[-1] if self.jitters else None,
-            blink=self.gaze.is_blinking(),
+    def _snapshot(self, t, h, v, blink):
+        return MetricsSnapshot(
+            t, h, v,
+            self.vert_saccades[-1] if self.vert_saccades else None,
+            self.horiz_saccades[-1] if self.horiz_saccades else None,
+            self.jitters[-1] if self.jitters else None,
+            blink,
         )
     
     def _check_axis(self, t, axis, val):
@@ -97,14 +219,111 @@ class PSPGazeMetrics:
                 self.horiz_saccades.append(rec)
             else:
                 self.vert_saccades.append(rec)
+            self._record(t, amp, vel, axis, "SACCADE")
             if self.debug:
                 print(f"[{axis}] SACCADE amp={amp:.3f} vel={vel:.3f}")
         elif abs(vel) > self.jitter_thresh:
             self.jitters.append((t, vel, axis))
             self.logger.log_event(t0, t, amp, vel, axis, "JITTER")
+            self._record(t, amp, vel, axis, "JITTER")
             if self.debug:
                 print(f"[{axis}] JITTER vel={vel:.3f}")
+
+    def _record(self, t, amp, vel, axis, kind):
+        key = (axis, kind)
+        self.amp_stats[key].add(amp)
+        self.vel_stats[key].add(vel)
+        recent = self._recent[key]
+        recent.append(t)
+        self._expire(recent, t)
+
+    def _expire(self, recent, now):
+        while recent and recent[0] <= now - self.rate_window:
+            recent.popleft()
+
+    def session_stats(self):
+        # running statistics per event type ("H-SACCADE", ...): count, amplitude and velocity
+        # mean/std/peak, and rate per minute over the last rate_window seconds of the session (over
+        # the whole session while it's shorter than rate_window)
+        stats = {}
+        span = min(self.rate_window, self._last_t - self._first_t) if self._last_t is not None else 0.0
+        for key, amp in self.amp_stats.items():
+            recent = self._recent[key]
+            if self._last_t is not None:
+                self._expire(recent, self._last_t)
+            stats["-".join(key)] = dict(
+                count=amp.count,
+                amp=amp.as_dict(),
+                vel=self.vel_stats[key].as_dict(),
+                rate_per_min=len(recent) * 60 / span if span > 0 else 0.0,
+            )
+        return stats
                 
-        def __del__(self):
-            if self.save_on_exit:
-                self.logger.to_csv()
+    def close(self, save=None):
+        # saves the log once, if save_on_exit is set (save=True saves it anyway, e.g. at the end of
+        # a stream). Called at interpreter exit for metrics still alive; a metrics collected before
+        # exit doesn't write anything
+        if save is None:
+            save = self.save_on_exit
+        if save and not self._saved:
+            self._saved = True
+            self.logger.save()
+
+
+def accepted_samples(blink, h, v, blink_skip_frames=3):
+    # mask of the samples PSPGazeMetrics.feed() runs the detection on: not a blink, not in the
+    # cooldown of the blink_skip_frames samples following a blink, and with both ratios located
+    blink = np.asarray(blink)
+    if blink.dtype.kind == "f":
+        blink = np.nan_to_num(blink)
+    blink = blink.astype(bool)
+    h = np.asarray(h, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+
+    # the cooldown of a blink covers the blink_skip_frames samples after the last blink
+    idx = np.arange(len(blink))
+    last_blink = np.maximum.accumulate(np.where(blink, idx, -blink_skip_frames - 1))
+    cooldown = np.zeros(len(blink), bool)
+    cooldown[1:] = idx[1:] - last_blink[:-1] <= blink_skip_frames
+
+    return ~blink & ~cooldown & ~np.isnan(h) & ~np.isnan(v)
+
+
+def detect_events(t, h, v, blink=None, vel_thresh=0.5, jitter_thresh=0.05, blink_skip_frames=3):
+    # vectorized version of the PSPGazeMetrics detection for a whole session:
+    # t, h, v, blink are per-frame arrays (NaN for missing ratios), results are identical to
+    # feeding the same samples to PSPGazeMetrics.feed() with the same thresholds.
+    # frames read back from an EventLogger log are already filtered, pass blink=None for them
+    t = np.asarray(t, dtype=np.float64)
+    h = np.asarray(h, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    if blink is None:
+        blink = np.zeros(len(t), bool)
+
+    keep = accepted_samples(blink, h, v, blink_skip_frames)
+    t, h, v = t[keep], h[keep], v[keep]
+    t0, t1 = t[:-1], t[1:]
+    dt = t1 - t0
+    valid = dt > 0
+
+    result = []
+    for val in (h, v):
+        dv = val[1:] - val[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vel = dv / dt
+        speed = np.abs(vel)
+        saccade = valid & (speed > vel_thresh)
+        jitter = valid & ~saccade & (speed > jitter_thresh)
+        result.append([_events(t0, t1, dv, vel, saccade), _events(t0, t1, dv, vel, jitter)])
+
+    (h_saccades, h_jitters), (v_saccades, v_jitters) = result
+    return DetectedEvents(h_saccades, v_saccades, h_jitters, v_jitters)
+
+
+def _events(t0, t1, dv, vel, mask):
+    events = np.empty(np.count_nonzero(mask), EVENT_DTYPE)
+    events["t0"] = t0[mask]
+    events["t1"] = t1[mask]
+    events["amp"] = np.abs(dv[mask])
+    events["vel"] = vel[mask]
+    return events
@@ -8,28 +8,53 @@ class Pupil(object):
     the position of the pupil
     """
 
-    def __init__(self, eye_frame, threshold):
+    # ACCURATE: bilateral filter, centroid of the iris contour
+    # FAST: gaussian blur, centroid of the largest dark connected component
+    ACCURATE = "accurate"
+    FAST = "fast"
+    MODES = (ACCURATE, FAST)
+
+    def __init__(self, eye_frame, threshold, mode=ACCURATE):
         self.iris_frame = None
         self.threshold = threshold
+        self.mode = mode
         self.x = None
         self.y = None
 
         self.detect_iris(eye_frame)
 
     @staticmethod
-    def image_processing(eye_frame, threshold):
+    def filtering(eye_frame, mode=ACCURATE):
+        """Smooths the eye frame and erodes it, which is the part of the
+        processing that doesn't depend on the threshold
+
+        Arguments:
+            eye_frame (numpy.ndarray): Frame containing an eye and nothing else
+            mode (str): Pupil.ACCURATE (bilateral filter) or Pupil.FAST (gaussian blur)
+
+        Returns:
+            The filtered frame, not binarized yet
+        """
+        kernel = np.ones((3, 3), np.uint8)
+        if mode == Pupil.FAST:
+            new_frame = cv2.GaussianBlur(eye_frame, (5, 5), 0)
+        else:
+            new_frame = cv2.bilateralFilter(eye_frame, 10, 15, 15)
+        return cv2.erode(new_frame, kernel, iterations=3)
+
+    @staticmethod
+    def image_processing(eye_frame, threshold, mode=ACCURATE):
         """Performs operations on the eye frame to isolate the iris
 
         Arguments:
             eye_frame (numpy.ndarray): Frame containing an eye and nothing else
             threshold (int): Threshold value used to binarize the eye frame
+            mode (str): Filtering mode, see filtering()
 
         Returns:
             A frame with a single element representing the iris
         """
-        kernel = np.ones((3, 3), np.uint8)
-        new_frame = cv2.bilateralFilter(eye_frame, 10, 15, 15)
-        new_frame = cv2.erode(new_frame, kernel, iterations=3)
+        new_frame = Pupil.filtering(eye_frame, mode)
         new_frame = cv2.threshold(new_frame, threshold, 255, cv2.THRESH_BINARY)[1]
 
         return new_frame
@@ -41,14 +66,43 @@ class Pupil(object):
         Arguments:
             eye_frame (numpy.ndarray): Frame containing an eye and nothing else
         """
-        self.iris_frame = self.image_processing(eye_frame, self.threshold)
+        self.iris_frame = self.image_processing(eye_frame, self.threshold, self.mode)
+        if self.mode == Pupil.FAST:
+            self.x, self.y = self.component_centroid(self.iris_frame)
+        else:
+            self.x, self.y = self.centroid(self.iris_frame)
+
+    @staticmethod
+    def centroid(iris_frame):
+        """Returns the (x, y) centroid of the iris in a binarized frame,
+        or (None, None) if it can't be found
 
-        contours, _ = cv2.findContours(self.iris_frame, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
+        Argument:
+            iris_frame (numpy.ndarray): Binarized iris frame
+        """
+        contours, _ = cv2.findContours(iris_frame, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
         contours = sorted(contours, key=cv2.contourArea)
 
         try:
             moments = cv2.moments(contours[-2])
-            self.x = int(moments['m10'] / moments['m00'])
-            self.y = int(moments['m01'] / moments['m00'])
+            return int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00'])
         except (IndexError, ZeroDivisionError):
-            pass
+            return None, None
+
+    @staticmethod
+    def component_centroid(iris_frame):
+        """Returns the (x, y) centroid of the largest dark connected component
+        of a binarized frame, or (None, None) if there is none. Unlike centroid(),
+        it doesn't extract nor sort the contours.
+
+        Argument:
+            iris_frame (numpy.ndarray): Binarized iris frame
+        """
+        nb_labels, _, stats, centroids = cv2.connectedComponentsWithStats(cv2.bitwise_not(iris_frame), connectivity=8)
+        if nb_labels < 2:
+            return None, None
+
+        # label 0 is the background, ie the white part of the frame
+        largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        x, y = centroids[largest]
+        return int(x), int(y)
@@ -0,0 +1,112 @@
+from __future__ import division
+import cv2
+from .psp_metrics import RunningStats
+
+
+class AdaptiveScheduler(object):
+    """
+    This class decides whether GazeTracking can reuse the result of the
+    last full analysis for a new frame. The eye regions of the new frame
+    are compared with the ones of the last analyzed frame: if none of them
+    changed by more than motion_threshold (mean absolute difference of
+    gray levels), the analysis is skipped. It never skips when the last
+    result had no pupils or a blink, nor more than max_skip frames in a row.
+
+    Accuracy drift is measured when a full analysis follows skipped frames:
+    it's the difference between the fresh ratios and the reused ones.
+    """
+
+    def __init__(self, motion_threshold=2.0, max_skip=5, margin=3):
+        """
+        Arguments:
+            motion_threshold (float): Mean gray level change above which an eye moved
+            max_skip (int): Maximum number of consecutive frames reusing a result
+            margin (int): Pixels added around each eye region for the motion check
+        """
+        self.motion_threshold = motion_threshold
+        self.max_skip = max_skip
+        self.margin = margin
+        self.reset()
+
+    def _crop(self, frame, box):
+        x0, y0, x1, y1 = box
+        region = frame[y0:y1, x0:x1]
+        if region.ndim == 3:
+            region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+        return region
+
+    def can_reuse(self, frame, gaze_frame):
+        """Returns True if the analysis of frame can be skipped and gaze_frame,
+        the result of the last analysis, reused
+
+        Arguments:
+            frame (numpy.ndarray): The new frame
+            gaze_frame (GazeFrame): Result of the last full analysis
+        """
+        if (not self._regions or not gaze_frame.pupils_located or gaze_frame.blinking
+                or self._streak >= self.max_skip):
+            return False
+
+        for x0, y0, x1, y1, previous in self._regions:
+            region = self._crop(frame, (x0, y0, x1, y1))
+            if region.shape != previous.shape or cv2.absdiff(region, previous).mean() > self.motion_threshold:
+                return False
+
+        self._streak += 1
+        self.skipped += 1
+        self._reused = gaze_frame
+        return True
+
+    def analyzed_frame(self, frame, eyes, gaze_frame):
+        """Stores the eye regions of a frame that was fully analyzed
+
+        Arguments:
+            frame (numpy.ndarray): The analyzed frame
+            eyes (list): The Eye objects found in the frame (None if no face)
+            gaze_frame (GazeFrame): Result of the analysis
+        """
+        self.analyzed += 1
+        reused = self._reused if self._streak else None
+        if reused is not None and gaze_frame.pupils_located:
+            self.drift_h.add(abs(gaze_frame.horizontal_ratio - reused.horizontal_ratio))
+            self.drift_v.add(abs(gaze_frame.vertical_ratio - reused.vertical_ratio))
+        self._streak = 0
+        self._reused = None
+
+        self._regions = []
+        height, width = frame.shape[:2]
+        for eye in eyes:
+            if eye is None or eye.frame is None:
+                self._regions = []
+                return
+            eye_height, eye_width = eye.frame.shape[:2]
+            box = (max(int(eye.origin[0]) - self.margin, 0), max(int(eye.origin[1]) - self.margin, 0),
+                   min(int(eye.origin[0]) + eye_width + self.margin, width),
+                   min(int(eye.origin[1]) + eye_height + self.margin, height))
+            region = self._crop(frame, box).copy()
+            if not region.size:
+                self._regions = []
+                return
+            self._regions.append(box + (region,))
+
+    def reset(self):
+        """Forgets the last analyzed frame and the counters, for a new
+        sequence of frames"""
+        self._regions = [] # (x0, y0, x1, y1, gray pixels) of the last analyzed frame
+        self._streak = 0
+        self._reused = None
+        self.analyzed = 0
+        self.skipped = 0
+        self.drift_h = RunningStats()
+        self.drift_v = RunningStats()
+
+    def stats(self):
+        """Returns the skip rate and the drift of the ratios measured after skips"""
+        total = self.analyzed + self.skipped
+        return dict(
+            analyzed=self.analyzed,
+            skipped=self.skipped,
+            skip_rate=self.skipped / total if total else 0.0,
+            drift_h=self.drift_h.as_dict(),
+            drift_v=self.drift_v.as_dict(),
+        )
@@ -0,0 +1,548 @@
+from __future__ import division
+import asyncio
+import itertools
+import json
+import multiprocessing
+import pickle
+import queue
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+from .instrumentation import LatencyHistogram
+
+# every message is: header length, payload length (network order), json header, binary payload
+_LENGTHS = struct.Struct("!II")
+
+
+def pack_message(header, payload=b""):
+    """Encodes a message of the service protocol"""
+    header = json.dumps(header, default=_to_json).encode()
+    return _LENGTHS.pack(len(header), len(payload)) + header + payload
+
+
+def _to_json(value):
+    # numpy scalars found in snapshots
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_frame(frame, encoding="raw", quality=95):
+    """Returns the (header fields, payload) of a frame sent to the service
+
+    Arguments:
+        frame (numpy.ndarray): BGR or gray frame
+        encoding (str): "raw" (exact pixels) or ".jpg"/".png"
+        quality (int): JPEG quality
+    """
+    if encoding == "raw":
+        frame = np.ascontiguousarray(frame)
+        return dict(encoding="raw", shape=list(frame.shape), dtype=str(frame.dtype)), frame.tobytes()
+    import cv2
+    ok, data = cv2.imencode(encoding, frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f"cannot encode frame as {encoding}")
+    return dict(encoding=encoding), data.tobytes()
+
+
+def decode_frame(header, payload):
+    """Rebuilds a frame from its header fields and payload"""
+    if header["encoding"] == "raw":
+        return np.frombuffer(payload, np.dtype(header["dtype"])).reshape(header["shape"])
+    import cv2
+    return cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class _EventCollector(object):
+    # logger of a service session: keeps the events of the current frame only
+    def __init__(self):
+        self.events = []
+
+    def log_frame(self, t, h, v, blink):
+        pass
+
+    def log_event(self, t0, t1, amp, vel, axis, kind):
+        self.events.append(dict(t0=t0, t1=t1, amp=amp, vel=vel, axis=axis, kind=kind))
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+    def save(self):
+        pass
+
+
+class _RemoteTraceback(Exception):
+    # traceback of an exception raised in a worker, chained as its cause when it's re-raised
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _failure(worker, error):
+    # results message reporting the exception that stops a worker, picklable whatever the exception
+    tb = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(f"{type(error).__name__}: {error}")
+    return ("failed", worker, error, tb)
+
+
+def _worker_main(worker, inbox, results, gaze_options, metrics_options):
+    """Worker process: loads the models once, then analyzes the frames of
+    its sessions in the order they arrive. Each session has its own
+    GazeTracking (and so its own Calibration) and PSPGazeMetrics. An
+    exception that stops the worker is sent to the service."""
+    try:
+        from . import models
+        from .gaze_tracking import GazeTracking
+        from .psp_metrics import PSPGazeMetrics
+
+        models.preload(gaze_options.get("model_path", models.DEFAULT_MODEL_PATH))
+        results.put(("ready", worker))
+        sessions = {}
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            kind, session, body = message
+
+            if kind == "open":
+                logger = _EventCollector()
+                metrics = PSPGazeMetrics(GazeTracking(**gaze_options), logger=logger, save_on_exit=False,
+                                         **metrics_options)
+                sessions[session] = metrics
+            elif kind == "close":
+                sessions.pop(session, None)
+            elif kind == "frame":
+                header, payload, received = body
+                reply = dict(type="snapshot", session=session, seq=header.get("seq"))
+                try:
+                    metrics = sessions[session]
+                    frame = decode_frame(header, payload)
+                    if frame is None:
+                        raise ValueError("cannot decode frame")
+                    reply["snapshot"] = metrics.update(frame, header.get("t"))._asdict()
+                    reply["events"] = metrics.logger.drain()
+                except Exception as e:
+                    reply["error"] = f"{type(e).__name__}: {e}"
+                results.put(("reply", reply, received))
+    except Exception as e:
+        results.put(_failure(worker, e))
+
+
+class _SessionStats(object):
+    def __init__(self, worker):
+        self.worker = worker
+        self.opened = time.monotonic()
+        self.sent = 0
+        self.done = 0
+        self.pending = deque() # seq of the frames in flight, in order
+        self.latency = LatencyHistogram()
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.opened
+        return dict(worker=self.worker, frames=self.done, in_flight=self.sent - self.done,
+                    fps=self.done / elapsed if elapsed > 0 else 0.0, latency=self.latency.summary())
+
+
+class GazeService(object):
+    """
+    This class serves gaze analysis to local client apps over a Unix
+    socket or localhost TCP. Frames are analyzed by a pool of worker
+    processes, each loading the models once. A session stays on the
+    worker it was opened on, so its frames are analyzed in order with its
+    own calibration and metrics state.
+
+    Client messages (json header + payload, see pack_message()):
+        {"type": "open"}                               -> {"type": "opened", "session": id}
+        {"type": "frame", "session": id, "seq": n, "t": time, <encode_frame() fields>} + pixels
+                                                       -> {"type": "snapshot", "session", "seq", "snapshot", "events"}
+        {"type": "close", "session": id}
+        {"type": "stats"}                              -> {"type": "stats", ...}
+
+    A reply with an "error" field replaces the snapshot of a frame that
+    couldn't be analyzed, e.g. because the worker of its session stopped.
+    Each worker queues at most max_pending frames: beyond that, the
+    service stops reading the client's socket until the worker catches up.
+    """
+
+    # seconds between two checks that the worker processes are alive
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, workers=2, gaze_options=None, metrics_options=None, max_pending=32):
+        """
+        Arguments:
+            workers (int): Number of worker processes
+            gaze_options (dict): Keyword arguments for the GazeTracking of each session
+            metrics_options (dict): Keyword arguments for the PSPGazeMetrics of each session
+            max_pending (int): Size of the inbox of each worker (frames and session messages)
+        """
+        self.nb_workers = workers
+        self.gaze_options = gaze_options or {}
+        self.metrics_options = metrics_options or {}
+        self.max_pending = max_pending
+
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes = []
+        self._processes = []
+        self._results = None
+        self._dispatcher = None
+        self._loop = None
+        self._stopping = False
+        self._failed = {}    # worker -> why it stopped
+
+        self._ids = itertools.count(1)
+        self._sessions = {}  # session -> _SessionStats
+        self._writers = {}   # session -> asyncio.StreamWriter of its client
+
+    def start_workers(self, timeout=None):
+        """Starts the worker processes and waits until they all loaded the
+        models. If a worker fails to start, the others are stopped and its
+        exception is raised (RuntimeError if it exited without one).
+
+        Argument:
+            timeout (float): Seconds to wait for the workers (TimeoutError after)
+        """
+        self._results = self._context.Queue()
+        self._stopping = False
+        self._failed = {}
+        for worker in range(self.nb_workers):
+            inbox = self._context.Queue(maxsize=self.max_pending)
+            process = self._context.Process(target=_worker_main, daemon=True,
+                                            args=(worker, inbox, self._results, self.gaze_options,
+                                                  self.metrics_options))
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ready = set()
+        while len(ready) < self.nb_workers:
+            try:
+                message = self._results.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                for worker, process in enumerate(self._processes):
+                    if worker not in ready and process.exitcode is not None:
+                        self._kill_workers()
+                        raise RuntimeError(f"gaze worker {worker} exited with code {process.exitcode} "
+                                           f"while loading the models")
+                if deadline is not None and time.monotonic() > deadline:
+                    self._kill_workers()
+                    raise TimeoutError(f"gaze workers not ready after {timeout}s")
+                continue
+            if message[0] == "failed":
+                _, worker, error, tb = message
+                self._kill_workers()
+                error.__cause__ = _RemoteTraceback(tb)
+                raise error
+            ready.add(message[1])
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="gaze-service-results", daemon=True)
+        self._dispatcher.start()
+
+    def _kill_workers(self):
+        for worker, process in enumerate(self._processes):
+            process.terminate()
+            process.join()
+            # data still buffered for a dead worker would block the exit of this process
+            self._inboxes[worker].cancel_join_thread()
+        self._inboxes, self._processes = [], []
+
+    def stop_workers(self, timeout=10):
+        """Stops the worker processes once they processed the frames they received
+
+        Argument:
+            timeout (float): Seconds given to each worker before it's terminated
+        """
+        self._stopping = True
+        for worker, inbox in enumerate(self._inboxes):
+            try:
+                if self._processes[worker].is_alive():
+                    inbox.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for worker, process in enumerate(self._processes):
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            if process.exitcode:
+                self._inboxes[worker].cancel_join_thread()
+        if self._dispatcher is not None:
+            self._results.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        self._inboxes, self._processes = [], []
+
+    def _dispatch(self):
+        # results thread: hands the replies over to the event loop and reports the workers that stopped
+        reported = set()
+        checked = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                return
+            if message and message[0] == "reply":
+                self._loop.call_soon_threadsafe(self._deliver, *message[1:])
+            elif message and message[0] == "failed":
+                _, worker, error, tb = message
+                reported.add(worker)
+                self._loop.call_soon_threadsafe(self._worker_failed, worker, f"{type(error).__name__}: {error}")
+
+            if time.monotonic() - checked >= self.POLL_INTERVAL and not self._stopping:
+                checked = time.monotonic()
+                for worker, process in enumerate(self._processes):
+                    if worker not in reported and process.exitcode is not None:
+                        reported.add(worker)
+                        self._loop.call_soon_threadsafe(self._worker_failed, worker,
+                                                        f"exited with code {process.exitcode}")
+
+    def _deliver(self, reply, received):
+        session = reply["session"]
+        stats = self._sessions.get(session)
+        if stats is not None:
+            stats.done += 1
+            if stats.pending:
+                stats.pending.popleft()
+            stats.latency.add(time.monotonic() - received)
+        writer = self._writers.get(session)
+        if writer is not None and not writer.is_closing():
+            writer.write(pack_message(reply))
+
+    def _worker_failed(self, worker, reason):
+        # the frames in flight on a stopped worker get an error reply, so no client waits for them
+        if self._stopping or worker >= len(self._inboxes):
+            return
+        self._failed[worker] = reason
+        self._inboxes[worker].cancel_join_thread()
+        for session, stats in self._sessions.items():
+            if stats.worker != worker:
+                continue
+            writer = self._writers.get(session)
+            while stats.pending:
+                seq = stats.pending.popleft()
+                if writer is not None and not writer.is_closing():
+                    writer.write(pack_message(self._worker_error(session, seq, worker)))
+            stats.done = stats.sent
+
+    def _worker_error(self, session, seq, worker):
+        return dict(type="snapshot", session=session, seq=seq,
+                    error=f"gaze worker {worker} stopped: {self._failed[worker]}")
+
+    async def _put(self, worker, message):
+        # queues a message for a worker without blocking the event loop: while its inbox is full,
+        # the client isn't read (backpressure). Returns False if the worker stopped.
+        inbox = self._inboxes[worker]
+        while worker not in self._failed:
+            try:
+                inbox.put_nowait(message)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.005)
+        return False
+
+    async def _open(self, writer):
+        # affinity: the session goes to the running worker with the fewest sessions and stays there.
+        # Returns None if every worker stopped.
+        load = [0] * self.nb_workers
+        for stats in self._sessions.values():
+            load[stats.worker] += 1
+        running = [worker for worker in range(self.nb_workers) if worker not in self._failed]
+        if not running:
+            return None
+        worker = min(running, key=load.__getitem__)
+        session = next(self._ids)
+        self._sessions[session] = _SessionStats(worker)
+        self._writers[session] = writer
+        await self._put(worker, ("open", session, None))
+        return session
+
+    async def _close(self, session):
+        stats = self._sessions.pop(session, None)
+        self._writers.pop(session, None)
+        if stats is not None:
+            await self._put(stats.worker, ("close", session, None))
+
+    def stats(self):
+        """Returns the frames in flight per worker and the stats of every session"""
+        depths = [0] * self.nb_workers
+        for stats in self._sessions.values():
+            depths[stats.worker] += stats.sent - stats.done
+        return dict(workers=self.nb_workers, queue_depths=depths,
+                    failed_workers={str(worker): reason for worker, reason in self._failed.items()},
+                    sessions={str(session): stats.as_dict() for session, stats in self._sessions.items()})
+
+    async def _handle(self, reader, writer):
+        owned = set()
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                kind = header.get("type")
+                if kind == "open":
+                    session = await self._open(writer)
+                    if session is None:
+                        writer.write(pack_message(dict(type="error", error="every gaze worker stopped")))
+                    else:
+                        owned.add(session)
+                        writer.write(pack_message(dict(type="opened", session=session)))
+                elif kind == "frame":
+                    session = header.get("session")
+                    if session not in owned:
+                        writer.write(pack_message(dict(type="error", session=session, seq=header.get("seq"),
+                                                       error="unknown session")))
+                        continue
+                    stats = self._sessions[session]
+                    if stats.worker in self._failed:
+                        writer.write(pack_message(self._worker_error(session, header.get("seq"), stats.worker)))
+                        continue
+                    stats.sent += 1
+                    stats.pending.append(header.get("seq"))
+                    # if the worker stops meanwhile, the frame gets its error reply from _worker_failed()
+                    await self._put(stats.worker, ("frame", session, (header, payload, time.monotonic())))
+                elif kind == "close":
+                    session = header.get("session")
+                    if session in owned:
+                        owned.discard(session)
+                        await self._close(session)
+                elif kind == "stats":
+                    writer.write(pack_message(dict(type="stats", **self.stats())))
+                else:
+                    writer.write(pack_message(dict(type="error", error=f"unknown message type {kind!r}")))
+                await writer.drain()
+        finally:
+            for session in owned:
+                await self._close(session)
+            writer.close()
+
+    async def serve(self, path=None, host="127.0.0.1", port=8765):
+        """Starts the workers and serves clients until cancelled
+
+        Arguments:
+            path (str): Unix socket path (if None, TCP on host:port)
+            host (str): TCP host, localhost by default
+            port (int): TCP port
+        """
+        self._loop = asyncio.get_running_loop()
+        await self._loop.run_in_executor(None, self.start_workers)
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self._handle, path)
+            else:
+                server = await asyncio.start_server(self._handle, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self._loop.run_in_executor(None, self.stop_workers)
+
+
+async def read_message(reader):
+    """Reads a message from an asyncio stream, returns (header, payload)"""
+    lengths = await reader.readexactly(_LENGTHS.size)
+    header_len, payload_len = _LENGTHS.unpack(lengths)
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+class GazeClient(object):
+    """
+    This class is a blocking client of GazeService. Frames can be sent
+    ahead of the replies (send_frame then receive) or one at a time
+    (analyze).
+    """
+
+    def __init__(self, path=None, host="127.0.0.1", port=8765):
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile("rb")
+        self._pending = deque()
+        self._seq = itertools.count()
+
+    def _send(self, header, payload=b""):
+        self._socket.sendall(pack_message(header, payload))
+
+    def _read(self):
+        lengths = self._file.read(_LENGTHS.size)
+        if len(lengths) < _LENGTHS.size:
+            raise ConnectionError("connection closed by the service")
+        header_len, payload_len = _LENGTHS.unpack(lengths)
+        header = json.loads(self._file.read(header_len))
+        if payload_len:
+            self._file.read(payload_len)
+        return header
+
+    def _read_type(self, kind):
+        # replies of another type (snapshots sent ahead) are kept for receive(). An error without
+        # seq isn't about a frame: it answers the request being waited for
+        while True:
+            header = self._read()
+            if header.get("type") == kind:
+                return header
+            if header.get("type") == "error" and "seq" not in header:
+                raise RuntimeError(f"gaze service: {header.get('error')}")
+            self._pending.append(header)
+
+    def open_session(self):
+        """Opens a session and returns its id"""
+        self._send(dict(type="open"))
+        return self._read_type("opened")["session"]
+
+    def close_session(self, session):
+        self._send(dict(type="close", session=session))
+
+    def send_frame(self, session, frame, t=None, encoding="raw"):
+        """Sends a frame without waiting for its snapshot, returns its sequence number
+
+        Arguments:
+            session (int): Session id
+            frame (numpy.ndarray): The frame to analyze
+            t (float): Capture time of the frame (default: now)
+            encoding (str): See encode_frame()
+        """
+        fields, payload = encode_frame(frame, encoding)
+        seq = next(self._seq)
+        self._send(dict(type="frame", session=session, seq=seq, t=time.time() if t is None else t, **fields),
+                   payload)
+        return seq
+
+    def receive(self):
+        """Returns the next reply: {"type": "snapshot", "session", "seq", "snapshot", "events"}"""
+        if self._pending:
+            return self._pending.popleft()
+        return self._read()
+
+    def analyze(self, session, frame, t=None, encoding="raw"):
+        """Sends a frame and waits for its snapshot"""
+        seq = self.send_frame(session, frame, t, encoding)
+        while True:
+            reply = self.receive()
+            if reply.get("seq") == seq and reply.get("session") == session:
+                return reply
+            self._pending.append(reply)
+
+    def stats(self):
+        self._send(dict(type="stats"))
+        return self._read_type("stats")
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
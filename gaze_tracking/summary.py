@@ -0,0 +1,340 @@
+import glob
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .logger import EVENT_KINDS, EventLogger, load_session
+
+# bumped when the features change: cached summaries of another version are recomputed
+ANALYZER_VERSION = 5
+
+FEATURES = ["duration_min", "blink_rate", "saccade_count", "saccade_rate", "saccade_velocity",
+            "saccade_amplitude", "jitter_count", "v_range"]
+
+
+# bytes of csv parsed at once: memory stays bounded whatever the length of the session
+CHUNK_BYTES = 16 << 20
+
+# columns of a psp_data.csv recording needed by the features, with their dtypes
+PSP_DATA_COLUMNS = {"t": "float64", "v_ratio": "float64", "blink": "boolean", "sac_start": "float64",
+                    "sac_amp": "float64", "sac_vel": "float64", "jitter_t": "float64"}
+
+# an EventLogger row once "key=value" fields are split: timestamp,type,key1,value1,key2,value2,key3,value3
+# (FRAME: h, v, blink; events: amp, vel, dt)
+EVENT_LOG_NAMES = ["timestamp", "type", "key1", "value1", "key2", "value2", "key3", "value3"]
+EVENT_LOG_COLUMNS = {"timestamp": "float64", "type": "category", "value1": "float64", "value2": "float64",
+                     "value3": "float64"}
+SESSION_EXTENSIONS = (".csv", ".pspg")
+# csv tables written next to the sessions by analyze_plot and batch_analyze, not session logs
+SUMMARY_NAMES = ("psp_summary.csv", "psp_batch_summary.csv")
+SACCADE_TYPES = ["H-SACCADE", "V-SACCADE"]
+JITTER_TYPES = ["H-JITTER", "V-JITTER"]
+
+
+class FeatureAccumulator(object):
+    """
+    This class computes the session features of analyze_plot /
+    analyze_tabular incrementally: frames and events are added chunk by
+    chunk and only running counts, sums and extrema are kept.
+    The blink rate is NaN when frames were added without their blinks.
+    """
+
+    def __init__(self):
+        self.first_t = None
+        self.last_t = None
+        self.blinks = 0
+        self.blinks_known = True
+        self.saccades = 0
+        self.amp_sum, self.amp_count = 0.0, 0
+        self.vel_sum, self.vel_count = 0.0, 0
+        self.jitters = 0
+        self.v_min = float("inf")
+        self.v_max = float("-inf")
+
+    def add_frames(self, t, v, blinks=0):
+        """
+        Arguments:
+            t (numpy.ndarray): Timestamps of the frames, in file order
+            v (numpy.ndarray): Vertical ratios of the frames (NaN when missing)
+            blinks (int): Number of blinking frames among them, None when the log
+                doesn't record blinks
+        """
+        if len(t):
+            if self.first_t is None:
+                self.first_t = float(t[0])
+            self.last_t = float(t[-1])
+        v = v[~np.isnan(v)]
+        if len(v):
+            self.v_min = min(self.v_min, float(v.min()))
+            self.v_max = max(self.v_max, float(v.max()))
+        if blinks is None:
+            self.blinks_known = False
+        else:
+            self.blinks += int(blinks)
+
+    def add_saccades(self, amp, vel):
+        """
+        Arguments:
+            amp (numpy.ndarray): Amplitudes of the saccades (NaN when missing)
+            vel (numpy.ndarray): Velocities of the saccades (NaN when missing)
+        """
+        self.saccades += len(vel)
+        amp, vel = amp[~np.isnan(amp)], vel[~np.isnan(vel)]
+        self.amp_sum += float(amp.sum())
+        self.amp_count += len(amp)
+        self.vel_sum += float(vel.sum())
+        self.vel_count += len(vel)
+
+    def add_jitters(self, count):
+        self.jitters += int(count)
+
+    def features(self):
+        """Returns the FEATURES of what was added"""
+        nan = float("nan")
+        duration_min = elapsed_seconds(self.first_t, self.last_t) / 60 if self.first_t is not None else nan
+        rate = (lambda n: n / duration_min) if duration_min > 0 else (lambda n: nan)
+        return dict(
+            duration_min=duration_min,
+            blink_rate=rate(self.blinks) if self.blinks_known else nan,
+            saccade_count=self.saccades,
+            saccade_rate=rate(self.saccades),
+            saccade_velocity=self.vel_sum / self.vel_count if self.vel_count else nan,
+            saccade_amplitude=self.amp_sum / self.amp_count if self.amp_count else nan,
+            jitter_count=self.jitters,
+            v_range=self.v_max - self.v_min if self.v_max >= self.v_min else nan,
+        )
+
+
+def elapsed_seconds(first_t, last_t):
+    # seconds between two timestamps as analyze_plot / analyze_tabular always measured them: on
+    # pd.to_datetime(t, unit="s"), i.e. timestamps rounded to the microsecond
+    return (pd.to_datetime(last_t, unit="s") - pd.to_datetime(first_t, unit="s")).total_seconds()
+
+
+def _blocks(f, chunk_bytes):
+    # blocks of whole lines of a file opened in binary mode
+    while True:
+        block = f.read(chunk_bytes)
+        if not block:
+            return
+        yield block + f.readline()
+
+
+def _read_block(block, names, columns, **options):
+    return pd.read_csv(io.BytesIO(block), header=None, names=names, usecols=list(columns), dtype=columns,
+                       engine="c", **options)
+
+
+def _add_psp_data(acc, chunk):
+    # psp_data.csv: one row per frame, with the saccade/jitter columns filled when one was detected
+    chunk = chunk[chunk["t"].notna()]
+    acc.add_frames(chunk["t"].to_numpy(), chunk["v_ratio"].to_numpy(), chunk["blink"].sum())
+    saccades = chunk[chunk["sac_start"].notna()]
+    acc.add_saccades(saccades["sac_amp"].to_numpy(), saccades["sac_vel"].to_numpy())
+    acc.add_jitters(chunk["jitter_t"].notna().sum())
+
+
+def _add_event_log(acc, chunk):
+    # EventLogger log: FRAME rows and one row per event, field values already split from their keys.
+    # PSPGazeMetrics doesn't log the frames where the eyes are closed, so the blinks are unknown
+    kind = chunk["type"]
+    frames = chunk[kind == "FRAME"]
+    acc.add_frames(frames["timestamp"].to_numpy(), frames["value2"].to_numpy(), blinks=None)
+    saccades = chunk[kind.isin(SACCADE_TYPES)]
+    acc.add_saccades(saccades["value1"].to_numpy(), saccades["value2"].to_numpy())
+    acc.add_jitters(kind.isin(JITTER_TYPES).sum())
+
+
+def iter_chunks(path, chunk_bytes=CHUNK_BYTES):
+    # yields (schema, DataFrame) chunks of a csv session log with only the needed columns, typed:
+    # schema is "psp_data" or "event_log". The file is parsed chunk_bytes at a time.
+    with open(path, "rb") as f:
+        header = f.readline().decode().strip().split(",")
+        if "h_ratio" in header:
+            missing = set(PSP_DATA_COLUMNS) - set(header)
+            if missing:
+                raise ValueError(f"{path} lacks the columns {sorted(missing)}")
+            for block in _blocks(f, chunk_bytes):
+                yield "psp_data", _read_block(block, header, PSP_DATA_COLUMNS)
+        elif header == EventLogger.HEADER:
+            for block in _blocks(f, chunk_bytes):
+                # "blink=True" -> "blink,1", "amp=0.113" -> "amp,0.113": values parse as floats in C
+                block = block.replace(b"=True", b"=1").replace(b"=False", b"=0").replace(b"=", b",")
+                yield "event_log", _read_block(block, EVENT_LOG_NAMES, EVENT_LOG_COLUMNS, na_values=["None"])
+        else:
+            raise ValueError(f"{path} is not a session log")
+
+
+def session_features(path, chunk_bytes=CHUNK_BYTES):
+    # features of one session file: a psp_data.csv recording, an EventLogger csv log or a .pspg session.
+    # csv logs are streamed, so memory doesn't grow with the session length
+    path = str(path)
+    acc = FeatureAccumulator()
+    if path.endswith(".pspg"):
+        session = load_session(path)
+        frames, events = session.frames, session.events
+        saccades = events[events["kind"] == EVENT_KINDS.index("SACCADE")]
+        # same frames as an EventLogger log: no blinks
+        acc.add_frames(np.asarray(frames["t"]), np.asarray(frames["v"], np.float64), blinks=None)
+        acc.add_saccades(np.asarray(saccades["amp"]), np.asarray(saccades["vel"]))
+        acc.add_jitters(np.count_nonzero(events["kind"] == EVENT_KINDS.index("JITTER")))
+        return acc.features()
+
+    for schema, chunk in iter_chunks(path, chunk_bytes):
+        if schema == "psp_data":
+            _add_psp_data(acc, chunk)
+        else:
+            _add_event_log(acc, chunk)
+    return acc.features()
+
+
+def session_series(path, chunk_bytes=CHUNK_BYTES):
+    # (t, v, saccade_t, saccade_v) arrays of a session file, for plots: frame timestamps and vertical
+    # ratios (NaN when missing), and the time and vertical ratio of each saccade. Events of logs don't
+    # carry the ratio, it's interpolated from the frames.
+    path = str(path)
+    if path.endswith(".pspg"):
+        session = load_session(path)
+        events = session.events[session.events["kind"] == EVENT_KINDS.index("SACCADE")]
+        t, v = np.asarray(session.frames["t"]), np.asarray(session.frames["v"], np.float64)
+        return t, v, np.asarray(events["t"]), _interp(events["t"], t, v)
+
+    parts = {"t": [], "v": [], "saccade_t": [], "saccade_v": []}
+    schema = None
+    for schema, chunk in iter_chunks(path, chunk_bytes):
+        if schema == "psp_data":
+            chunk = chunk[chunk["t"].notna()]
+            saccades = chunk[chunk["sac_start"].notna()]
+            parts["t"].append(chunk["t"].to_numpy())
+            parts["v"].append(chunk["v_ratio"].to_numpy())
+            parts["saccade_t"].append(saccades["t"].to_numpy())
+            parts["saccade_v"].append(saccades["v_ratio"].to_numpy())
+        else:
+            frames = chunk[chunk["type"] == "FRAME"]
+            parts["t"].append(frames["timestamp"].to_numpy())
+            parts["v"].append(frames["value2"].to_numpy())
+            parts["saccade_t"].append(chunk.loc[chunk["type"].isin(SACCADE_TYPES), "timestamp"].to_numpy())
+    t, v, saccade_t, saccade_v = (np.concatenate(parts[name]) if parts[name] else np.empty(0)
+                                  for name in ("t", "v", "saccade_t", "saccade_v"))
+    if schema == "event_log":
+        saccade_v = _interp(saccade_t, t, v)
+    return t, v, saccade_t, saccade_v
+
+
+def _interp(at, t, v):
+    known = ~np.isnan(v)
+    if not known.any():
+        return np.full(len(at), np.nan)
+    return np.interp(np.asarray(at, np.float64), t[known], v[known])
+
+
+def session_files(inputs, exclude=()):
+    # sorted session files (.csv, .pspg) of a list of files, directories (searched recursively)
+    # and glob patterns, without the SUMMARY_NAMES tables and the paths in exclude
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files.update(os.path.join(root, name) for name in names if name.endswith(SESSION_EXTENSIONS))
+        else:
+            files.update(glob.glob(item, recursive=True))
+    exclude = {os.path.abspath(path) for path in exclude if path}
+    return sorted(path for path in files
+                  if os.path.basename(path) not in SUMMARY_NAMES and os.path.abspath(path) not in exclude)
+
+
+def file_hash(path, block_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _summarize(path):
+    # pool job: features of a file, or the error that prevented them
+    try:
+        return session_features(path)
+    except Exception as e:
+        return dict(error=f"{type(e).__name__}: {e}")
+
+
+class SummaryCache(object):
+    """
+    This class keeps the features of session files in a json file, keyed
+    by the sha1 of their content. The size and modification time of each
+    path are remembered too, so unchanged files aren't read again to be
+    hashed. Summaries of another ANALYZER_VERSION are dropped.
+    """
+
+    def __init__(self, path):
+        """
+        Argument:
+            path (str): The json file (created on save())
+        """
+        self.path = str(path)
+        self.files = {}      # path -> [size, mtime_ns, sha1]
+        self.summaries = {}  # sha1 -> features
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") == ANALYZER_VERSION:
+            self.files = data["files"]
+            self.summaries = data["summaries"]
+
+    def known_hash(self, path):
+        """Returns the sha1 of a file if it didn't change since it was hashed, else None"""
+        stat = os.stat(path)
+        entry = self.files.get(os.path.abspath(path))
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        return None
+
+    def set_hash(self, path, sha):
+        stat = os.stat(path)
+        self.files[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, sha]
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(version=ANALYZER_VERSION, files=self.files, summaries=self.summaries), f)
+        os.replace(tmp, self.path)
+
+
+def summarize(paths, workers=None, cache=None):
+    # features of many session files in a process pool, as a DataFrame with one row per path (in
+    # order) and an error column for files that couldn't be read. With a SummaryCache, only new or
+    # changed files are hashed and only unknown contents are analyzed; failures aren't cached.
+    paths = [str(p) for p in paths]
+    hashes = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if cache is not None:
+            for path in paths:
+                hashes[path] = cache.known_hash(path)
+            todo = [path for path in paths if hashes[path] is None]
+            for path, sha in zip(todo, pool.map(file_hash, todo, chunksize=16)):
+                hashes[path] = sha
+                cache.set_hash(path, sha)
+            # one analysis per content, even when several paths share it
+            jobs = {}
+            for path in paths:
+                if hashes[path] not in cache.summaries:
+                    jobs.setdefault(hashes[path], path)
+            failed = {}
+            for sha, result in zip(jobs, pool.map(_summarize, jobs.values(), chunksize=16)):
+                if "error" in result:
+                    failed[sha] = result
+                else:
+                    cache.summaries[sha] = result
+            results = [failed.get(hashes[path]) or cache.summaries[hashes[path]] for path in paths]
+        else:
+            results = list(pool.map(_summarize, paths, chunksize=16))
+
+    table = pd.DataFrame([dict(session=path, **result) for path, result in zip(paths, results)])
+    columns = ["session"] + FEATURES + (["error"] if "error" in table else [])
+    return table.reindex(columns=columns)
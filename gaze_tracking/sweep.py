@@ -0,0 +1,141 @@
+import itertools
+import numpy as np
+from .psp_metrics import accepted_samples
+from .summary import elapsed_seconds
+
+# classification cutoffs (low, high) of analyze_tabular: a value above low is "Moderate",
+# above high "High" (at or above for the jitter count, like classify_jitter)
+CUTOFFS = {
+    "blink_rate": (5, 10),
+    "saccade_velocity": (0.6, 1.0),
+    "saccade_amplitude": (0.08, 0.15),
+    "jitter_count": (10, 30),
+    "v_range": (0.2, 0.35),
+}
+CATEGORIES = np.array(["Low", "Moderate", "High"])
+# category of a feature the session can't give (the blink rate of a log)
+UNKNOWN = "Unknown"
+_INCLUSIVE = {"jitter_count"}
+
+
+class _Tail(object):
+    # events of one axis sorted by speed |vel|, with suffix sums: the count, amplitude sum and
+    # (signed) velocity sum of the events faster than any threshold are a searchsorted away,
+    # for a whole grid
+    def __init__(self, vel, amp):
+        speed = np.abs(vel)
+        order = np.argsort(speed, kind="stable")
+        self.speed = speed[order]
+        self._amp = np.concatenate([np.cumsum(amp[order][::-1])[::-1], [0.0]])
+        self._vel = np.concatenate([np.cumsum(vel[order][::-1])[::-1], [0.0]])
+
+    def above(self, thresh):
+        # (count, amp sum, vel sum) of the events with speed > thresh, thresh of any shape
+        first = np.searchsorted(self.speed, thresh, side="right")
+        return len(self.speed) - first, self._amp[first], self._vel[first]
+
+
+def _axis_tails(t, h, v, blink, blink_skip_frames):
+    # per-axis tails of the sample-to-sample moves PSPGazeMetrics would classify
+    keep = accepted_samples(blink, h, v, blink_skip_frames)
+    t = t[keep]
+    dt = t[1:] - t[:-1]
+    valid = dt > 0
+    tails = []
+    for val in (h[keep], v[keep]):
+        dv = (val[1:] - val[:-1])[valid]
+        tails.append(_Tail(dv / dt[valid], np.abs(dv)))
+    return tails
+
+
+def sweep(t, h, v, blink=None, vel_thresh=(0.5,), jitter_thresh=(0.05,), blink_skip_frames=(3,), cutoffs=None):
+    # evaluates every combination of detection thresholds on a session at once and returns a
+    # tidy table: a dict of equal-length columns, one row per combination.
+    # t, h, v, blink are per-frame arrays like for detect_events(); counts match what
+    # PSPGazeMetrics logs with the same thresholds. blink=None is for frames read back from a log,
+    # which holds no blinking frames: their blink rate is NaN and its category UNKNOWN.
+    # The features are those of summary.session_features() and the analyze scripts: saccade
+    # velocity is the mean signed velocity of the saccades of both axes, amplitude their mean |amp|
+    # (both 0 without saccades, like analyze_tabular). cutoffs maps a CUTOFFS feature to a list of
+    # (low, high) pairs to sweep too; features not given use CUTOFFS.
+    t = np.asarray(t, dtype=np.float64)
+    h = np.asarray(h, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    blinks_known = blink is not None
+    if blink is None:
+        blink = np.zeros(len(t), bool)
+    blink = np.asarray(blink)
+
+    # thresholds broadcast as (vel_thresh, jitter_thresh) for each blink_skip_frames
+    vel = np.asarray(vel_thresh, dtype=np.float64)[:, None]
+    jit = np.asarray(jitter_thresh, dtype=np.float64)[None, :]
+    skips = list(blink_skip_frames)
+    shape = (len(skips), vel.shape[0], jit.shape[1])
+
+    # features that don't depend on the thresholds
+    duration_min = elapsed_seconds(t[0], t[-1]) / 60 if len(t) > 1 else 0.0
+    blinks = np.count_nonzero(np.nan_to_num(blink.astype(np.float64)))
+    blink_rate = blinks / duration_min if duration_min > 0 else 0.0
+    if not blinks_known:
+        blink_rate = np.nan
+    v_range = float(np.nanmax(v) - np.nanmin(v)) if np.any(~np.isnan(v)) else 0.0
+
+    columns = dict(h_saccades=np.zeros(shape, np.int64), v_saccades=np.zeros(shape, np.int64),
+                   jitters=np.zeros(shape, np.int64), amp_sum=np.zeros(shape), vel_sum=np.zeros(shape))
+    for i, skip in enumerate(skips):
+        for axis, tail in zip("hv", _axis_tails(t, h, v, blink, skip)):
+            saccades, amp, vel_sum = tail.above(vel)
+            # a move is a jitter when jitter_thresh < speed <= vel_thresh
+            columns[f"{axis}_saccades"][i] += np.broadcast_to(saccades, shape[1:])
+            columns["jitters"][i] += tail.above(jit)[0] - tail.above(np.maximum(vel, jit))[0]
+            columns["amp_sum"][i] += np.broadcast_to(amp, shape[1:])
+            columns["vel_sum"][i] += np.broadcast_to(vel_sum, shape[1:])
+
+    saccades = columns["h_saccades"] + columns["v_saccades"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        features = dict(
+            blink_rate=np.full(shape, blink_rate),
+            saccade_velocity=np.where(saccades > 0, columns.pop("vel_sum") / saccades, 0.0),
+            saccade_amplitude=np.where(saccades > 0, columns.pop("amp_sum") / saccades, 0.0),
+            jitter_count=columns["jitters"],
+            v_range=np.full(shape, v_range),
+        )
+
+    # every combination of the cutoff choices, on top of the threshold grid
+    cutoffs = dict(cutoffs or {})
+    choices = [list(cutoffs.get(name, [CUTOFFS[name]])) for name in CUTOFFS]
+    table = {name: [] for name in ("blink_skip_frames", "vel_thresh", "jitter_thresh")}
+    table.update({name: [] for name in ("h_saccades", "v_saccades", "saccades", "saccade_rate")})
+    table.update({name: [] for name in CUTOFFS})
+    for name in CUTOFFS:
+        if name in cutoffs:
+            table[f"{name}_low"], table[f"{name}_high"] = [], []
+        table[f"{name}_category"] = []
+
+    grid = np.meshgrid(np.asarray(skips), vel.ravel(), jit.ravel(), indexing="ij")
+    for combination in itertools.product(*choices):
+        table["blink_skip_frames"].append(grid[0].ravel())
+        table["vel_thresh"].append(grid[1].ravel())
+        table["jitter_thresh"].append(grid[2].ravel())
+        table["h_saccades"].append(columns["h_saccades"].ravel())
+        table["v_saccades"].append(columns["v_saccades"].ravel())
+        table["saccades"].append(saccades.ravel())
+        table["saccade_rate"].append((saccades / duration_min if duration_min > 0 else saccades * 0.0).ravel())
+        for name, (low, high) in zip(CUTOFFS, combination):
+            values = features[name].ravel()
+            table[name].append(values)
+            if name in cutoffs:
+                table[f"{name}_low"].append(np.full(values.shape, low))
+                table[f"{name}_high"].append(np.full(values.shape, high))
+            categories = CATEGORIES[classify(values, low, high, name in _INCLUSIVE)]
+            table[f"{name}_category"].append(np.where(np.isnan(values), UNKNOWN, categories))
+
+    return {name: np.concatenate(parts) for name, parts in table.items()}
+
+
+def classify(values, low, high, inclusive=False):
+    # category codes (index in CATEGORIES) of values for the cutoffs, as in analyze_tabular
+    values = np.asarray(values)
+    if inclusive:
+        return (values >= low).astype(np.int8) + (values >= high)
+    return (values > low).astype(np.int8) + (values > high)
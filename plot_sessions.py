@@ -0,0 +1,33 @@
+#vertical gaze plots of many sessions, rendered headless in parallel
+#
+#   python plot_sessions.py sessions/ -o plots/ --method lttb
+
+import argparse
+import time
+from gaze_tracking.plotting import METHODS, render_sessions
+from gaze_tracking.summary import session_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the vertical gaze plot of many sessions")
+    parser.add_argument("inputs", nargs="+", help="session files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="plots", help="folder of the images")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--method", choices=METHODS, default="minmax", help="decimation of the series")
+    parser.add_argument("--width", type=int, default=1000, help="image width (px)")
+    parser.add_argument("--height", type=int, default=400, help="image height (px)")
+    args = parser.parse_args()
+
+    start = time.time()
+    paths = session_files(args.inputs)
+    results = render_sessions(paths, args.output_dir, workers=args.workers, method=args.method,
+                              width=args.width, height=args.height)
+    for path, result in zip(paths, results):
+        if isinstance(result, Exception):
+            print(f"[PLOT] {path}: {type(result).__name__}: {result}")
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"[PLOT] {len(paths) - failed} plots in {time.time() - start:.1f}s → {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
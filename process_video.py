@@ -0,0 +1,42 @@
+#batch processing of recorded sessions
+
+import argparse
+import os
+import time
+from gaze_tracking.frame_cache import FrameCache
+from gaze_tracking.logger import BinaryEventLogger, EventLogger
+from gaze_tracking.offline import process_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PSP gaze pipeline on recorded videos")
+    parser.add_argument("videos", nargs="+", help="video files to process")
+    parser.add_argument("-o", "--output", help="session log (only with a single video)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=300, help="frames per job")
+    parser.add_argument("--binary", action="store_true", help="write a binary session file (.pspg) instead of csv")
+    parser.add_argument("--track-face", action="store_true", help="track the face box between frames")
+    parser.add_argument("--detection-scale", type=float, default=1.0, help="scale of the frame used for face detection")
+    parser.add_argument("--cache", help="folder caching the per-frame analysis, to re-run the metrics quickly")
+    parser.add_argument("--cache-size", type=float, default=2.0, help="size of the cache folder (GB)")
+    args = parser.parse_args()
+
+    if args.output and len(args.videos) > 1:
+        parser.error("--output can only be used with a single video")
+
+    cache = FrameCache(args.cache, max_bytes=int(args.cache_size * (1 << 30))) if args.cache else None
+    for path in args.videos:
+        start = time.time()
+        if args.binary:
+            logger = BinaryEventLogger(args.output or os.path.splitext(path)[0] + ".pspg")
+        else:
+            logger = EventLogger(args.output or os.path.splitext(path)[0] + ".csv")
+        process_video(path, logger=logger, workers=args.workers, chunk_size=args.chunk_size,
+                      gaze_options=dict(track_face=args.track_face, detection_scale=args.detection_scale),
+                      cache=cache)
+        logger.save()
+        print(f"[OFFLINE] {path} processed in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#threshold study: detection thresholds and classification cutoffs swept over sessions
+#
+#   python sweep_thresholds.py psp_data.csv session_1.csv --vel 0.2:2:19 --jitter 0.01:0.2:20 --skip 0 1 3 5 -o sweep.csv
+#
+#sessions are psp_data.csv recordings, EventLogger csv logs or binary .pspg sessions. Logs only
+#contain the frames kept by PSPGazeMetrics, so blink_skip_frames doesn't change their results
+#and their blink rate is unknown.
+
+import argparse
+import numpy as np
+import pandas as pd
+from gaze_tracking.logger import load_session
+from gaze_tracking.sweep import CUTOFFS, sweep
+
+
+def load_series(path):
+    """Returns the (t, h, v, blink) arrays of a session file, blink is None for logs"""
+    if path.endswith(".pspg"):
+        # like csv logs, no blinking frame was logged
+        frames = load_session(path).frames
+        return frames["t"], frames["h"], frames["v"], None
+
+    df = pd.read_csv(path)
+    if "h_ratio" in df:
+        blink = df["blink"].map({True: True, "True": True}).fillna(False).astype(bool)
+        return df["t"].to_numpy(), df["h_ratio"].to_numpy(), df["v_ratio"].to_numpy(), blink.to_numpy()
+
+    # EventLogger log: FRAME rows are "h=0.595", "v=0.675", "blink=False"
+    frames = df[df["type"] == "FRAME"]
+    values = [pd.to_numeric(frames[field].str.split("=").str[1], errors="coerce") for field in ("field1", "field2")]
+    return frames["timestamp"].to_numpy(), values[0].to_numpy(), values[1].to_numpy(), None
+
+
+def grid(text):
+    """"start:stop:num" (inclusive linspace) or a single value"""
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(text)])
+
+
+def cutoff_pairs(text):
+    """"low,high;low,high..." -> [(low, high), ...]"""
+    return [tuple(float(x) for x in pair.split(",")) for pair in text.split(";")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the PSP detection thresholds and classification cutoffs")
+    parser.add_argument("sessions", nargs="+", help="session files")
+    parser.add_argument("--vel", type=grid, default=grid("0.5"), help="vel_thresh values, start:stop:num")
+    parser.add_argument("--jitter", type=grid, default=grid("0.05"), help="jitter_thresh values, start:stop:num")
+    parser.add_argument("--skip", type=int, nargs="+", default=[3], help="blink_skip_frames values")
+    for name in CUTOFFS:
+        parser.add_argument(f"--{name.replace('_', '-')}-cutoffs", type=cutoff_pairs, dest=name,
+                            help=f"(low, high) pairs to sweep, default {CUTOFFS[name][0]},{CUTOFFS[name][1]}")
+    parser.add_argument("-o", "--output", help="write the table as csv")
+    args = parser.parse_args()
+
+    cutoffs = {name: getattr(args, name) for name in CUTOFFS if getattr(args, name)}
+    tables = []
+    for path in args.sessions:
+        t, h, v, blink = load_series(path)
+        table = pd.DataFrame(sweep(t, h, v, blink, args.vel, args.jitter, args.skip, cutoffs))
+        table.insert(0, "session", path)
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+
+    print(f"[SWEEP] {len(table)} rows, {len(table) // len(args.sessions)} combinations per session")
+    print(table.head(20).to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import cv2
+import dlib
+import pytest
+
+from gaze_tracking import models
+from benchmarks.bench_pipeline import CLIP, CLIP_SIZE
+from benchmarks.synthetic import SyntheticFace
+
+
+class ClipModels(object):
+    """
+    Stands for the HOG detector and the landmark model on the checked-in
+    clip: the detector finds the rendered face, the predictor returns the
+    renderer's landmarks of the frame being analyzed.
+    """
+
+    def __init__(self):
+        self.face = SyntheticFace(*CLIP_SIZE)
+        self.index = 0
+
+    def detect(self, frame, upsample=0):
+        face = self.face
+        return [dlib.rectangle(face.cx - face.face_w // 2, face.cy - face.face_h // 2,
+                               face.cx + face.face_w // 2, face.cy + face.face_h // 2)]
+
+    def predict(self, frame, box):
+        landmarks = self.face.landmarks(self.index)
+        landmarks.rect = box
+        return landmarks
+
+
+@pytest.fixture
+def clip_models(monkeypatch):
+    stub = ClipModels()
+    monkeypatch.setattr(models, "face_detector", lambda: stub.detect)
+    monkeypatch.setattr(models, "shape_predictor", lambda model_path=models.DEFAULT_MODEL_PATH: stub.predict)
+    return stub
+
+
+def clip_frames():
+    capture = cv2.VideoCapture(str(CLIP))
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        capture.release()
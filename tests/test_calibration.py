@@ -0,0 +1,65 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from gaze_tracking.calibration import Calibration, profile_path
+from gaze_tracking.pupil import Pupil
+
+
+def _threshold_search(eye_frame, mode):
+    # Calibration.find_best_threshold before the histogram: binarize and measure for every candidate
+    trials = {}
+    for threshold in range(5, 100, 5):
+        iris_frame = Pupil.image_processing(eye_frame, threshold, mode)
+        trials[threshold] = Calibration.iris_size(iris_frame)
+    best_threshold, iris_size = min(trials.items(), key=(lambda p: abs(p[1] - 0.48)))
+    return best_threshold
+
+
+def _eye_frame(rng):
+    # bright eye with a dark iris of random size and contrast, noise, and the white mask around
+    height, width = rng.integers(16, 40), rng.integers(30, 70)
+    frame = np.clip(rng.normal(rng.uniform(60, 200), rng.uniform(2, 30), (height, width)), 0, 255)
+    center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+    cv2.circle(frame, center, int(rng.integers(2, height)), float(rng.uniform(0, 90)), -1)
+    frame = frame.astype(np.uint8)
+    frame[:, :int(rng.integers(0, 6))] = 255
+    return frame
+
+
+@pytest.mark.parametrize("mode", Pupil.MODES)
+def test_histogram_threshold_matches_search(mode):
+    rng = np.random.default_rng(3)
+    for _ in range(300):
+        eye_frame = _eye_frame(rng)
+        assert Calibration.find_best_threshold(eye_frame, mode=mode) == _threshold_search(eye_frame, mode)
+    # uniform noise covers every gray level
+    for _ in range(50):
+        eye_frame = rng.integers(0, 256, (rng.integers(12, 40), rng.integers(12, 60)), np.uint8)
+        assert Calibration.find_best_threshold(eye_frame, mode=mode) == _threshold_search(eye_frame, mode)
+
+
+def test_profile_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    calibration = Calibration(Pupil.FAST, adapt_rate=0.1)
+    while not calibration.is_complete():
+        for side in (0, 1):
+            calibration.evaluate(_eye_frame(rng), side)
+    calibration.evaluate(_eye_frame(rng), 0)  # adapted left threshold
+    assert calibration.adapted[0] is not None and calibration.adapted[1] is None
+
+    path = profile_path(tmp_path / "profiles", "subject 1", "cam/0")
+    assert os.path.dirname(path) == str(tmp_path / "profiles") and "/" not in os.path.basename(path)
+    calibration.save(path)
+    loaded = Calibration.from_profile(path, Pupil.FAST, adapt_rate=0.1)
+    for name in ("pupil_mode", "nb_frames", "sums", "counts", "adapted", "adapt_rate"):
+        assert getattr(loaded, name) == getattr(calibration, name), name
+    assert loaded.is_complete()
+    assert [loaded.threshold(side) for side in (0, 1)] == [calibration.threshold(side) for side in (0, 1)]
+
+    # a new subject starts uncalibrated, a profile of the other mode is refused
+    assert not Calibration.from_profile(tmp_path / "other.json", Pupil.FAST).is_complete()
+    with pytest.raises(ValueError, match="pupil mode"):
+        Calibration.from_profile(path, Pupil.ACCURATE)
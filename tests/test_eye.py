@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import SyntheticLandmarks
+from gaze_tracking.eye import Eye
+
+
+def _isolate_full_frame(frame, region):
+    # Eye._isolate before it masked the crop only: the whole frame is masked, then cropped
+    height, width = frame.shape[:2]
+    black_frame = np.zeros((height, width), np.uint8)
+    mask = np.full((height, width), 255, np.uint8)
+    cv2.fillPoly(mask, [region], (0, 0, 0))
+    eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
+
+    margin = 5
+    min_x = np.min(region[:, 0]) - margin
+    max_x = np.max(region[:, 0]) + margin
+    min_y = np.min(region[:, 1]) - margin
+    max_y = np.max(region[:, 1]) + margin
+    return eye[min_y:max_y, min_x:max_x], (min_x, min_y)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_isolate_matches_full_frame_mask(seed):
+    rng = np.random.default_rng(seed)
+    height, width = 120, 160
+    frame = rng.integers(0, 256, (height, width), np.uint8)
+    for _ in range(50):
+        # eyes anywhere, including across the edges of the frame
+        cx, cy = rng.integers(-10, width + 10), rng.integers(-10, height + 10)
+        eye_points = np.column_stack([cx + rng.integers(-20, 21, 6), cy + rng.integers(-8, 9, 6)])
+        points = np.zeros((68, 2), int)
+        points[Eye.LEFT_EYE_POINTS] = eye_points
+        landmarks = SyntheticLandmarks(points)
+
+        eye = Eye.__new__(Eye)
+        eye._isolate(frame, landmarks, Eye.LEFT_EYE_POINTS)
+        expected, origin = _isolate_full_frame(frame, eye_points.astype(np.int32))
+        assert eye.frame.shape == expected.shape
+        assert np.array_equal(eye.frame, expected)
+        assert eye.origin == origin
+        assert eye.center == (expected.shape[1] / 2, expected.shape[0] / 2)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from gaze_tracking.calibration import Calibration
+from gaze_tracking.frame_cache import FrameCache
+from gaze_tracking.scheduler import AdaptiveScheduler
+
+
+def test_config_hash_ignores_runtime_counters():
+    scheduler = AdaptiveScheduler()
+    options = dict(track_face=True, scheduler=scheduler)
+    before = FrameCache.config_hash(options, chunk_size=300)
+
+    scheduler.analyzed, scheduler.skipped = 120, 30
+    scheduler.drift_h.add(0.01)
+    assert FrameCache.config_hash(options, chunk_size=300) == before
+    assert FrameCache.config_hash(dict(options, scheduler=AdaptiveScheduler(max_skip=2)), chunk_size=300) != before
+
+
+def test_config_hash_keys_the_starting_calibration():
+    calibration = Calibration()
+    options = dict(calibration=calibration)
+    before = FrameCache.config_hash(options)
+    calibration.evaluate(np.full((20, 40), 200, np.uint8), 0)
+    assert FrameCache.config_hash(options) != before
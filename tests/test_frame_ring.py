@@ -0,0 +1,51 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from gaze_tracking import GazeTracking
+from gaze_tracking.frame_ring import FrameRing
+from conftest import clip_frames
+
+
+def test_close_after_reading_frames():
+    ring = FrameRing((4, 6), slots=3)
+    reader = FrameRing.attach(ring.name)
+    for i in range(5):
+        ring.write(np.full((4, 6), i, np.uint8), t=i)
+
+    frames = reader.frames(timeout=0)
+    seq, t, frame = next(frames)
+    assert (seq, t, int(frame[0, 0])) == (2, 2.0, 2)
+    with pytest.raises(BufferError):
+        reader.close()
+
+    # the failed close left the ring usable
+    assert reader.head == 4 and reader.valid(seq)
+    assert int(next(frames)[2][0, 0]) == 3
+
+    # once the caller drops its view, the suspended generator doesn't keep one
+    del frame
+    reader.close()
+    ring.close()
+
+
+def test_close_after_gaze_tracking(clip_models):
+    clip = list(itertools.islice(clip_frames(), 6))
+    ring = FrameRing(clip[0].shape, slots=4)
+    for frame in clip:
+        ring.write(frame)
+
+    gaze = GazeTracking()
+    results = []
+    for seq, t, frame in ring.frames(timeout=0):
+        clip_models.index = seq
+        results.append(gaze.refresh(frame))
+    assert len(results) == 4 and results[-1].pupils_located
+
+    del frame
+    # GazeTracking still holds the last slot
+    with pytest.raises(BufferError):
+        ring.close()
+    gaze.release_frame()
+    ring.close()
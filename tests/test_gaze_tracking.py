@@ -0,0 +1,61 @@
+import pytest
+
+from gaze_tracking import GazeTracking
+from conftest import clip_frames
+
+
+@pytest.mark.parametrize("track_face", [False, True])
+def test_refresh_on_clip(clip_models, track_face):
+    gaze = GazeTracking(track_face=track_face)
+    located = frames = 0
+    for index, frame in enumerate(clip_frames()):
+        clip_models.index = index
+        result = gaze.refresh(frame)
+        assert result is gaze.gaze_frame
+        frames += 1
+
+        truth = clip_models.face.iris_centers(index)
+        if truth[0] is None or not result.pupils_located:
+            continue
+        located += 1
+        for found, center in zip((result.pupil_left, result.pupil_right), truth):
+            assert abs(found[0] - center[0]) <= 3 and abs(found[1] - center[1]) <= 3
+
+    assert frames == 90
+    assert located >= 80
+    assert gaze.calibration.is_complete()
+    if track_face:
+        assert gaze.tracked_frames > gaze.detector_runs
+
+
+def test_tracked_box_has_detector_geometry(clip_models):
+    gaze = GazeTracking(track_face=True)
+    frames = clip_frames()
+    gaze.refresh(next(frames))
+    detected = clip_models.detect(None)[0]
+    for index, frame in enumerate(frames, 1):
+        clip_models.index = index
+        gaze.refresh(frame)
+        assert abs(gaze._face_box.left() - detected.left()) <= 1
+        assert abs(gaze._face_box.right() - detected.right()) <= 1
+        assert abs(gaze._face_box.top() - detected.top()) <= 1
+        assert abs(gaze._face_box.bottom() - detected.bottom()) <= 1
+    assert gaze.detector_runs == 3 # every redetect_interval frames
+
+
+def test_shape_jump_triggers_detection(clip_models):
+    gaze = GazeTracking(track_face=True)
+    predict = clip_models.predict
+    frames = list(clip_frames())[:3]
+    gaze.refresh(frames[0])
+
+    # the predictor shrinks the face on a tracked frame: the detector runs again
+    def shrunk(frame, box):
+        landmarks = predict(frame, box)
+        for point in landmarks._points:
+            point.x = clip_models.face.cx + (point.x - clip_models.face.cx) // 2
+        return landmarks
+    gaze._predictor = shrunk
+    gaze.refresh(frames[1])
+    assert gaze.tracking_failures == 1
+    assert gaze.detector_runs == 2
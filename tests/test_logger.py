@@ -0,0 +1,84 @@
+import gc
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from gaze_tracking.logger import EventLogger, StreamingEventLogger
+from gaze_tracking.psp_metrics import PSPGazeMetrics
+
+
+def run(code, cwd):
+    # runs code in a new interpreter, so its exit can be observed
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parents[1]))
+    subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=cwd, env=env, check=True)
+
+
+def test_streaming_logger_is_flushed_at_exit(tmp_path):
+    run("""
+        from gaze_tracking.logger import StreamingEventLogger
+        logger = StreamingEventLogger("log.csv", flush_interval=60)
+        for i in range(1000):
+            logger.log_frame(i, 0.5, 0.5, False)
+        """, tmp_path)
+    assert len((tmp_path / "log.csv").read_text().splitlines()) == 1001
+
+
+def test_stopped_writer_raises_instead_of_blocking(tmp_path):
+    logger = StreamingEventLogger(tmp_path / "log.csv", buffer_size=2, batch_size=1)
+    logger._file.close() # the next write fails and stops the writer thread
+    with pytest.raises(RuntimeError):
+        for i in range(100):
+            logger.log_frame(i, 0.5, 0.5, False)
+    assert isinstance(logger.error, ValueError)
+    logger.close()
+
+
+def test_metrics_save_at_exit_not_when_collected(tmp_path):
+    metrics = PSPGazeMetrics(None, logger=EventLogger(tmp_path / "collected.csv"))
+    del metrics
+    gc.collect()
+    assert not (tmp_path / "collected.csv").exists()
+
+    run("""
+        from gaze_tracking.logger import EventLogger
+        from gaze_tracking.psp_metrics import PSPGazeMetrics
+        metrics = PSPGazeMetrics(None, logger=EventLogger("exit.csv"))
+        metrics.feed(0.0, 0.5, 0.5, False)
+        """, tmp_path)
+    assert len((tmp_path / "exit.csv").read_text().splitlines()) == 2
+
+
+def test_stream_saves_the_log_once(tmp_path):
+    run("""
+        import asyncio
+        from gaze_tracking.gaze_tracking import NO_GAZE
+        from gaze_tracking.logger import EventLogger
+        from gaze_tracking.psp_metrics import PSPGazeMetrics
+
+        class Gaze(object):
+            def refresh(self, frame):
+                return NO_GAZE
+
+        class Camera(object):
+            frames = 3
+            def read(self):
+                self.frames -= 1
+                return self.frames >= 0, None
+
+        class Logger(EventLogger):
+            def save(self):
+                with open("saves.txt", "a") as f:
+                    f.write("save\\n")
+
+        async def main():
+            return [snapshot async for snapshot in metrics.stream(Camera())]
+
+        # still alive at exit, with the default save_on_exit
+        metrics = PSPGazeMetrics(Gaze(), logger=Logger())
+        assert len(asyncio.run(main())) == 3
+        """, tmp_path)
+    assert (tmp_path / "saves.txt").read_text().splitlines() == ["save"]
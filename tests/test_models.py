@@ -0,0 +1,16 @@
+import threading
+
+from gaze_tracking import models
+
+
+def test_face_detector_per_thread():
+    main = models.face_detector()
+    assert models.face_detector() is main
+
+    others = []
+    threads = [threading.Thread(target=lambda: others.append(models.face_detector())) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(main)} | {id(detector) for detector in others}) == 3
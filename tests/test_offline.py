@@ -0,0 +1,37 @@
+import numpy as np
+
+from gaze_tracking import GazeTracking
+from gaze_tracking.calibration import Calibration
+from gaze_tracking.offline import _chunk_gaze, _init_worker, _open_at, _process_chunk, calibrate
+from gaze_tracking.scheduler import AdaptiveScheduler
+from conftest import CLIP, clip_frames
+
+
+def test_open_at_lands_on_the_frame():
+    frames = list(clip_frames())
+    for start in (1, 37, 89):
+        capture = _open_at(str(CLIP), start)
+        ret, frame = capture.read()
+        capture.release()
+        assert ret
+        assert np.array_equal(frame, frames[start])
+
+
+def test_each_chunk_starts_from_the_calibrated_state(clip_models):
+    # adaptive calibration, face tracking and the scheduler keep state from frame to frame
+    options = dict(track_face=True, scheduler=AdaptiveScheduler(),
+                   calibration=Calibration(adapt_rate=0.5, adapt_interval=1))
+    gaze = GazeTracking(**options)
+    assert calibrate(str(CLIP), gaze)
+    calibrated = (list(gaze.calibration.sums), list(gaze.calibration.adapted))
+    _init_worker(gaze.calibration, options)
+
+    job = (str(CLIP), 60, 75, 30.0)
+    alone = _process_chunk(job)
+    _process_chunk((str(CLIP), 0, 60, 30.0))
+    assert _process_chunk(job).tobytes() == alone.tobytes()
+
+    fresh = _chunk_gaze()
+    assert (fresh.calibration.sums, fresh.calibration.adapted) == calibrated
+    assert fresh._face_box is None
+    assert fresh.scheduler.analyzed == fresh.scheduler.skipped == 0
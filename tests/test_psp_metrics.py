@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from gaze_tracking.logger import EventLogger
+from gaze_tracking.psp_metrics import EVENT_DTYPE, MetricsSnapshot, PSPGazeMetrics, detect_events
+
+
+def test_snapshot_reads_like_a_dict():
+    snapshot = MetricsSnapshot(12.5, 0.4, 0.6, None, None, None, False)
+    assert snapshot["h_ratio"] == 0.4
+    assert "blink" in snapshot and "count" not in snapshot and 0.4 not in snapshot
+    assert snapshot.get("count") is None and snapshot.get("count", 1) == 1
+    assert snapshot.get("v_ratio") == 0.6
+    assert list(snapshot.keys()) == list(snapshot._fields)
+    assert dict(snapshot) == snapshot._asdict()
+    assert dict(snapshot.items()) == snapshot._asdict()
+    with pytest.raises(KeyError):
+        snapshot["count"]
+    # still a tuple
+    assert snapshot[1] == 0.4 and tuple(snapshot)[0] == 12.5
+
+
+def test_rate_per_min_of_a_short_session():
+    metrics = PSPGazeMetrics(None, logger=EventLogger(), save_on_exit=False)
+    assert metrics.session_stats()["V-SACCADE"]["rate_per_min"] == 0.0
+    # 4 V-saccades in 3 s, with the default 60 s window
+    for i in range(5):
+        metrics.feed(i * 0.75, 0.5, 0.2 if i % 2 else 0.8, False)
+    stats = metrics.session_stats()
+    assert stats["V-SACCADE"]["count"] == 4
+    assert stats["V-SACCADE"]["rate_per_min"] == 80.0
+    assert stats["H-SACCADE"]["rate_per_min"] == 0.0
+
+
+class _EventRecorder(object):
+    # logger keeping the events PSPGazeMetrics logs, per (axis, kind)
+    def __init__(self):
+        self.events = {(axis, kind): [] for axis in "HV" for kind in ("SACCADE", "JITTER")}
+
+    def log_frame(self, t, h, v, blink):
+        pass
+
+    def log_event(self, t0, t1, amp, vel, axis, kind):
+        self.events[axis, kind].append((t0, t1, amp, vel))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_detect_events_matches_feed(seed):
+    rng = np.random.default_rng(seed)
+    n = 400
+    # repeated timestamps (dt == 0), missing ratios and blinks in bursts
+    t = np.cumsum(rng.choice([0.0, 1 / 30, 1 / 15, 0.1], n, p=[0.05, 0.7, 0.15, 0.1])) + 1000
+    h = 0.5 + np.cumsum(rng.normal(0, 0.03, n))
+    v = rng.uniform(0.2, 0.8, n)
+    h[rng.random(n) < 0.05] = np.nan
+    v[rng.random(n) < 0.05] = np.nan
+    blink = np.convolve(rng.random(n) < 0.02, np.ones(3), "same") > 0
+    options = dict(vel_thresh=rng.uniform(0.2, 1.0), jitter_thresh=rng.uniform(0.01, 0.1),
+                   blink_skip_frames=int(rng.integers(0, 5)))
+
+    recorder = _EventRecorder()
+    metrics = PSPGazeMetrics(None, logger=recorder, save_on_exit=False, **options)
+    for ts, hs, vs, bs in zip(t.tolist(), h.tolist(), v.tolist(), blink.tolist()):
+        metrics.feed(ts, None if np.isnan(hs) else hs, None if np.isnan(vs) else vs, bs)
+
+    detected = detect_events(t, h, v, blink, **options)
+    for name, key in [("h_saccades", ("H", "SACCADE")), ("v_saccades", ("V", "SACCADE")),
+                      ("h_jitters", ("H", "JITTER")), ("v_jitters", ("V", "JITTER"))]:
+        expected = np.array(recorder.events[key], EVENT_DTYPE)
+        assert getattr(detected, name).tobytes() == expected.tobytes(), name
+    assert sum(len(events) for events in detected) > 0
@@ -0,0 +1,46 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from gaze_tracking.service import _LENGTHS, GazeClient, GazeService, pack_message
+
+
+def test_worker_start_failure_is_raised(tmp_path):
+    service = GazeService(workers=2, gaze_options=dict(model_path=str(tmp_path / "missing.dat")))
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="missing.dat") as error:
+        service.start_workers()
+    assert "Traceback" in str(error.value.__cause__) # the worker's traceback
+    assert time.monotonic() - start < 30
+    assert service._processes == []
+
+
+def test_open_session_raises_the_service_error(tmp_path):
+    path = str(tmp_path / "service.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+
+    def serve():
+        # what GazeService answers "open" once every worker stopped
+        connection, _ = server.accept()
+        with connection, connection.makefile("rb") as f:
+            header_len, payload_len = _LENGTHS.unpack(f.read(_LENGTHS.size))
+            f.read(header_len + payload_len)
+            connection.sendall(pack_message(dict(type="snapshot", session=0, seq=3)))
+            connection.sendall(pack_message(dict(type="error", error="every gaze worker stopped")))
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    client = GazeClient(path)
+    try:
+        with pytest.raises(RuntimeError, match="every gaze worker stopped"):
+            client.open_session()
+        # the snapshot received meanwhile is still there
+        assert client.receive()["seq"] == 3
+    finally:
+        client.close()
+        thread.join()
+        server.close()
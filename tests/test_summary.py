@@ -0,0 +1,60 @@
+import math
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from gaze_tracking.logger import BinaryEventLogger, EventLogger
+from gaze_tracking.summary import session_features, session_files
+
+
+def _log_session(logger):
+    for i in range(30):
+        logger.log_frame(i / 10, 0.5, 0.5 + 0.01 * (i % 3), False)
+    # the velocity feature is the mean signed velocity, like in the analyze scripts
+    logger.log_event(0.9, 1.0, 0.2, 2.0, "H", "SACCADE")
+    logger.log_event(1.9, 2.0, 0.1, -1.0, "V", "SACCADE")
+    logger.save()
+
+
+def test_event_log_features(tmp_path):
+    path = tmp_path / "session.csv"
+    _log_session(EventLogger(path))
+    features = session_features(path)
+    assert features["saccade_count"] == 2
+    assert features["saccade_velocity"] == 0.5
+    # the log has no blinking frames to count
+    assert math.isnan(features["blink_rate"])
+
+
+def test_binary_log_features(tmp_path):
+    path = tmp_path / "session.pspg"
+    _log_session(BinaryEventLogger(path))
+    features = session_features(path)
+    assert features["saccade_velocity"] == 0.5
+    assert math.isnan(features["blink_rate"])
+
+
+PSP_DATA = Path(__file__).parent.parent / "psp_data.csv"
+
+
+def test_psp_data_keeps_blink_rate():
+    features = session_features(PSP_DATA)
+    assert features["blink_rate"] > 0
+    # mean of the signed sac_vel, as analyze_plot / analyze_tabular always computed it
+    sac_vel = pd.read_csv(PSP_DATA)["sac_vel"].dropna()
+    assert features["saccade_velocity"] == pytest.approx(sac_vel.mean(), rel=1e-12)
+
+
+def test_duration_matches_datetime_timestamps():
+    # analyze_plot measured the duration on datetimes, to the microsecond
+    t = pd.to_datetime(pd.read_csv(PSP_DATA)["t"].dropna(), unit="s")
+    assert session_features(PSP_DATA)["duration_min"] == (t.iloc[-1] - t.iloc[0]).total_seconds() / 60
+
+
+def test_session_files_skip_summary_tables(tmp_path):
+    for name in ("a.csv", "b.pspg", "notes.txt", "psp_summary.csv", "psp_batch_summary.csv", "out.csv"):
+        (tmp_path / name).touch()
+    assert session_files([str(tmp_path)], exclude=[str(tmp_path / "out.csv")]) == \
+        [str(tmp_path / "a.csv"), str(tmp_path / "b.pspg")]
+    assert session_files([str(tmp_path / "*.csv")]) == [str(tmp_path / "a.csv"), str(tmp_path / "out.csv")]
@@ -0,0 +1,32 @@
+import math
+from pathlib import Path
+
+import pytest
+
+from gaze_tracking.summary import session_features
+from gaze_tracking.sweep import UNKNOWN, sweep
+from sweep_thresholds import load_series
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_sweep_matches_summary_on_a_log():
+    path = str(ROOT / "session_1.csv")
+    table = {name: column[0] for name, column in sweep(*load_series(path)).items()}
+    features = session_features(path)
+    assert table["saccades"] == features["saccade_count"]
+    assert table["jitter_count"] == features["jitter_count"]
+    assert table["saccade_rate"] == features["saccade_rate"]
+    # signed mean; the log keeps 3 decimals of the velocities the summary reads
+    assert table["saccade_velocity"] == pytest.approx(features["saccade_velocity"], abs=2e-3)
+    assert math.isnan(table["blink_rate"]) and table["blink_rate_category"] == UNKNOWN
+
+
+def test_sweep_velocity_is_the_signed_mean():
+    t = [0.0, 0.1, 0.2, 0.3]
+    v = [0.5, 0.7, 0.6, 0.6]
+    table = sweep(t, [0.5] * 4, v, [False] * 4)
+    # +2.0 then -1.0
+    assert table["saccades"][0] == 2
+    assert table["saccade_velocity"][0] == pytest.approx(0.5)
+    assert table["blink_rate"][0] == 0 and table["blink_rate_category"][0] == "Low"